@@ -0,0 +1,66 @@
+"""
+Compares the sniffing python-engine reader with utils.loading.read_scores.
+
+    python benchmarks/bench_loading.py --rows 1000000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils.loading import read_scores  # noqa: E402
+
+
+def write_result_file(path, rows, sep=","):
+    rng = np.random.default_rng(0)
+    activity = (rng.random(rows) < 0.05).astype(np.int8)
+    scores = np.round(rng.normal(-7, 1.5, rows) - activity, 3)
+    pd.DataFrame({"score": scores, "activity": activity}).to_csv(path, sep=sep, index=False)
+
+
+def python_engine(path):
+    return pd.read_csv(path, sep=None, engine="python")
+
+
+def best_of(func, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    readers = {
+        "python engine (sep=None)": python_engine,
+        "read_scores (c)": lambda path: read_scores(path, engine="c"),
+        "read_scores (auto)": read_scores,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for sep, name in ((",", "comma"), (";", "semicolon"), ("\t", "tab")):
+            path = os.path.join(tmp, f"{name}.csv")
+            write_result_file(path, args.rows, sep)
+
+            print(f"{args.rows} rows, {name} separated")
+            baseline = None
+            for label, reader in readers.items():
+                elapsed = best_of(reader, path, args.repeat)
+                baseline = baseline or elapsed
+                print(f"  {label:<26} {elapsed:8.3f} s  ({baseline / elapsed:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
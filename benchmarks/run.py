@@ -0,0 +1,177 @@
+"""
+Times the stages of the metrics engine on artificial screens of growing size
+and records their peak memory, to catch performance regressions.
+
+    python benchmarks/run.py --sizes 1000 100000 --save benchmarks/baseline.json
+    python benchmarks/run.py --sizes 1000 100000 --compare benchmarks/baseline.json
+
+Every stage runs on the seeded scores of ``generate_artificial_scores`` for each
+size and active fraction. The time is the best of ``--repeat`` runs; the peak
+memory is measured with tracemalloc in a separate run, since tracing slows the
+code down. ``--compare`` exits with status 1 when a stage got slower than the
+baseline by more than ``--tolerance``.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from model.bootstrap import DEFAULT_RESAMPLES  # noqa: E402
+from model.pydockstats import calculate_curves, fit_predict  # noqa: E402
+from utils.calcs import bedroc_score, calculate_enrichment_factor  # noqa: E402
+from utils.putils import generate_artificial_scores, num_derivative  # noqa: E402
+
+# Constants
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+ACTIVE_FRACTIONS = [0.01, 0.05, 0.2]
+SEED = 0
+# timings below this are too noisy to report as regressions
+MIN_SECONDS = 1e-3
+
+
+def make_screen(n, active_fraction):
+    data = generate_artificial_scores(n, seed=SEED, active_fraction=active_fraction)
+    scores = np.r_[data["ligands"], data["decoys"]]
+    activity = np.r_[np.ones(len(data["ligands"]), dtype=int), np.zeros(len(data["decoys"]), dtype=int)]
+    return scores, activity
+
+
+def stages(scores, activity):
+    """The benchmarked stages, as name: callable without arguments."""
+    predictions = fit_predict(scores, activity)
+    # the metrics rank the compounds by their fitted probability, as calculate_curves does
+    percentiles = np.arange(1, len(predictions) + 1) / len(predictions)
+    sorted_predictions = np.sort(predictions)
+
+    return {
+        "fit_predict": lambda: fit_predict(scores, activity),
+        "calculate_curves": lambda: calculate_curves("benchmark", scores, activity),
+        "calculate_curves (bootstrap)": lambda: calculate_curves("benchmark", scores, activity,
+                                                                 n_resamples=DEFAULT_RESAMPLES),
+        "bedroc_score": lambda: bedroc_score(activity, predictions),
+        "calculate_enrichment_factor": lambda: calculate_enrichment_factor(activity, predictions, 0.01),
+        "num_derivative": lambda: num_derivative(percentiles, sorted_predictions),
+    }
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes, active_fractions, repeat, only=None):
+    results = []
+    for n in sizes:
+        for active_fraction in active_fractions:
+            scores, activity = make_screen(n, active_fraction)
+            for stage, func in stages(scores, activity).items():
+                if only and stage not in only:
+                    continue
+
+                result = {
+                    "stage": stage,
+                    "n": n,
+                    "active_fraction": active_fraction,
+                    "seconds": best_time(func, repeat),
+                    "peak_mb": peak_memory(func) / 2 ** 20,
+                }
+                results.append(result)
+                print(f"{stage:<32} n={n:<10} actives={active_fraction:<5g} "
+                      f"{result['seconds']:9.4f} s  {result['peak_mb']:9.1f} MB", flush=True)
+    return results
+
+
+def result_key(result):
+    return result["stage"], result["n"], result["active_fraction"]
+
+
+def compare(results, baseline, tolerance):
+    """Prints the change against the baseline and returns the regressed results."""
+    previous = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+
+    print(f"\n{'stage':<32} {'n':<10} {'actives':<8} {'baseline':>10} {'now':>10} {'change':>8}")
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+
+        change = result["seconds"] / before["seconds"] - 1
+        flag = ""
+        if change > tolerance and result["seconds"] - before["seconds"] > MIN_SECONDS:
+            regressions.append(result)
+            flag = "  REGRESSION"
+        print(f"{result['stage']:<32} {result['n']:<10} {result['active_fraction']:<8g} "
+              f"{before['seconds']:10.4f} {result['seconds']:10.4f} {change:+8.1%}{flag}")
+
+    return regressions
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Numbers of compounds")
+    parser.add_argument("--actives", type=float, nargs="+", default=ACTIVE_FRACTIONS,
+                        help="Fractions of actives")
+    parser.add_argument("--stages", nargs="+", help="Only run these stages")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", metavar="JSON", help="Write the results as a new baseline")
+    parser.add_argument("--compare", metavar="JSON", help="Compare the results with a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Slowdown over the baseline reported as a regression (default: 0.25, i.e. 25%%)")
+    args = parser.parse_args()
+
+    # deprecation notices of the installed scikit-learn are not part of the benchmark
+    warnings.simplefilter("ignore", FutureWarning)
+
+    results = run(args.sizes, args.actives, args.repeat, args.stages)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"\nBaseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != environment():
+            print("\nWarning: the baseline was recorded on a different environment")
+
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,64 @@
-import pickle
 # app imports ----------------
+import time
+
+import numpy as np
+import pandas as pd
 import streamlit as st
 import utils.app_utils as utils
 import info as info
 from components.expander import ProgramsExpanders
-from components.charts import Predictiveness, ReceiverOperatingCharacteristic, PrecisionRecall
-from utils.saving import EmailSender, FigureDownloader
+from utils.saving import FigureDownloader, email_queue, EMAIL_POLL_INTERVAL
+from utils import profiling
 from utils.putils import generate_artificial_scores
+from utils.checkpoint import Checkpoint, write_checkpoint, CHECKPOINT_EXTENSION
+from model.bootstrap import DEFAULT_RESAMPLES
+
+
+def chart_download_button(container, downloader: FigureDownloader, chart, file_name: str, key: str, pending: list):
+    # the image is rendered only on request, unless this exact figure is already cached
+    placeholder = container.empty()
+    if not downloader.is_rendered(chart):
+        if not placeholder.button("🖼️ Prepare chart download", key=f"{key}_prepare", type='secondary',
+                                  use_container_width=True, help="Render the chart as a PNG image"):
+            return
+
+    # the render runs in the background; the button is filled in once the whole page is drawn
+    pending.append((placeholder, downloader.submit(chart), file_name, key))
+
+
+def await_download_buttons(pending: list):
+    for placeholder, future, file_name, key in pending:
+        placeholder.download_button(
+            label="📥 Download chart",
+            data=future.result(),
+            file_name=file_name,
+            mime="image/png",
+            use_container_width=True,
+            key=key
+        )
+
+
+def performance_panel(container):
+    """Time and memory of the profiled stages, slowest stage first."""
+    with container.expander("⏱️ Performance"):
+        records = profiling.records()
+        if st.button("🧹 Clear", key="clear_profile", type='secondary', use_container_width=True):
+            profiling.clear()
+            records = []
+        if not records:
+            st.caption("No stage profiled yet.")
+            return
+
+        df = pd.DataFrame(records)
+        summary = df.groupby("stage").agg(calls=("seconds", "size"), seconds=("seconds", "sum"),
+                                          peak_mb=("peak_mb", "max")).sort_values("seconds", ascending=False)
+        if summary["peak_mb"].isna().all():
+            # profiled without tracemalloc
+            summary = summary.drop(columns="peak_mb")
+        st.dataframe(summary.style.format({"seconds": "{:.3f}", "peak_mb": "{:.1f}"}, na_rep="–"))
+        st.caption(f"Peak resident memory of the app: {df['max_rss_mb'].max():.0f} MB. "
+                   "Stages of every session are included.")
+
 
 # Set the page configuration
 st.set_page_config(
@@ -27,33 +79,52 @@ info.general_help()
 
 # Initialize the expanders for programs
 programs_expanders = ProgramsExpanders()
+email_pending = False
 
 # Sidebar for checkpoints
 st.sidebar.header("📌Checkpoints")
 save_cp_container = st.sidebar.container()
 upload_cp_container = st.sidebar.container()
 
+# Sidebar for the settings of the metrics, drawn after a checkpoint had the chance to set them
+st.sidebar.header("⚙️ Settings")
+settings_container = st.sidebar.container()
+
+# Sidebar panel of the profiled stages, filled in once the page is drawn
+performance_container = st.sidebar.container() if profiling.enabled() else None
+
 # Upload checkpoint section
 with upload_cp_container:
-    input_checkpoint = st.file_uploader("📁 Upload a checkpoint file", type="pkl", key="input_checkpoint", 
+    input_checkpoint = st.file_uploader("📁 Upload a checkpoint file", type=CHECKPOINT_EXTENSION, key="input_checkpoint", 
                                         help="Upload a checkpoint file to continue from where you left off")
     load_button = st.button("📤 Load", key="load", type='secondary', help="Load a checkpoint file", disabled=not input_checkpoint,
                             use_container_width=True)
     
     if input_checkpoint and load_button:
         # Load the checkpoint file
-        import_dict = pickle.loads(input_checkpoint.read())
-
-        # Update the expanders with the loaded data
-        programs_expanders.from_data_dict(import_dict)
-
-        # Reset the cached images paths
-        st.session_state['paths'] = dict()
-
-        # Generate the expanders
-        programs_expanders.generate()
-
-        st.success("✔️ Checkpoint loaded successfully.")
+        try:
+            checkpoint = Checkpoint(input_checkpoint)
+        except ValueError as error:
+            st.error(f"Checkpoint not loaded. {error}")
+        else:
+            # Update the expanders with the loaded data
+            programs_expanders.from_data_dict(checkpoint)
+
+            # the settings are part of the data hash, so the saved curves are only reused with the saved settings
+            st.session_state['n_resamples'] = checkpoint.settings.get('n_resamples', 0)
+
+            # programs saved with their curves are only checked against their data hash
+            programs_expanders.generate(n_resamples=st.session_state['n_resamples'])
+            st.session_state['curves_settings'] = dict(n_resamples=st.session_state['n_resamples'])
+
+            st.success("✔️ Checkpoint loaded successfully.")
+
+with settings_container:
+    n_resamples = st.number_input("Bootstrap resamples", min_value=0, max_value=10 * DEFAULT_RESAMPLES,
+                                  step=100, key="n_resamples",
+                                  help="Resamples of the 95% confidence intervals of the AUC and BEDROC "
+                                       f"(e.g. {DEFAULT_RESAMPLES}). 0 disables the intervals, which are "
+                                       "the slowest part of the metrics.")
 
 # Save checkpoint section
 with save_cp_container:
@@ -100,25 +171,27 @@ if len(st.session_state['programs']) > 0:
                                 disabled=not programs_expanders.all_data_inputted())
                     
     if generate_button:
-        st.session_state['paths'] = dict()
         with st.spinner("Generating data..."):
-            programs_expanders.generate()
+            progress_bar = st.progress(0)
+            programs_expanders.generate(
+                on_progress=lambda done, total, name: progress_bar.progress(
+                    done / total, text=f"Generated \"{name}\" ({done}/{total})"),
+                n_resamples=n_resamples
+            )
+            st.session_state['curves_settings'] = dict(n_resamples=n_resamples)
         st.rerun()
 
 # If all data is generated, display the figures and download options
 if programs_expanders.all_data_generated():
-    downloader = FigureDownloader("figures", engine='matplotlib')
+    downloader = FigureDownloader(engine='matplotlib')
+    pending_downloads = []
 
     with st.spinner("Generating figures..."):
-        pc = Predictiveness()
-        roc = ReceiverOperatingCharacteristic()
-        precision_recall = PrecisionRecall()
-
-        pc.add_prevalence_line(programs_expanders.programs)
-        for program in programs_expanders.programs:
-            pc.add_plot(program)
-            roc.add_plot(program)
-            precision_recall.add_plot(program)
+        # the charts live in the session and only rebuild the curves of changed programs
+        charts = st.session_state['charts']
+        pc, roc, precision_recall = charts['pc'], charts['roc'], charts['precision_recall']
+        for chart in (pc, roc, precision_recall):
+            chart.sync(programs_expanders.programs)
         
         with st.container() as pc_container:
             pc.render()
@@ -127,14 +200,7 @@ if programs_expanders.all_data_generated():
 
             st.write("")
 
-            download_btn = pc_download_col.download_button(
-                label="📥 Download chart",
-                data=downloader.read_image(downloader.download(pc)),
-                file_name="pc.png",
-                mime="image/png",
-                use_container_width=True,
-                key="pc_download"
-            )
+            chart_download_button(pc_download_col, downloader, pc, "pc.png", "pc_download", pending_downloads)
             info.pc_interpretation_help()
 
         # Receiver Operating Characteristic (ROC)
@@ -142,14 +208,7 @@ if programs_expanders.all_data_generated():
             roc.render()
             _, roc_download_col, _ = st.columns([1, 2, 1])
             st.write("")
-            download_btn = roc_download_col.download_button(
-                label="📥 Download chart",
-                data=downloader.read_image(downloader.download(roc)),
-                file_name="roc.png",
-                mime="image/png",
-                use_container_width=True,
-                key="roc_download"
-            )
+            chart_download_button(roc_download_col, downloader, roc, "roc.png", "roc_download", pending_downloads)
             info.roc_interpretation_help()
             
             with st.expander("### BEDROC Metric"):
@@ -162,6 +221,11 @@ if programs_expanders.all_data_generated():
                     The metric below shows the BEDROC value for each program, with the delta value compared to the previous program.
                     """
                 )
+                if n_resamples:
+                    st.markdown(f"Its 95% bootstrap confidence interval is shown below it (the actives and the decoys "
+                                f"are resampled separately {n_resamples} times).")
+                else:
+                    st.markdown("Set the bootstrap resamples in the sidebar to also show its 95% confidence interval.")
 
             # BEDROC metric
             num_programs = len(programs_expanders.programs)
@@ -182,6 +246,39 @@ if programs_expanders.all_data_generated():
                                 delta = 0.0
                             st.metric(label=f"{program.name} BEDROC", value=round(program.bedroc, 3),
                                       delta=round(delta, 3), delta_color='normal')
+                            low, high = program.bedroc_ci
+                            if not np.isnan(low):
+                                st.caption(f"95% CI: {low:.3f} – {high:.3f}")
+
+            # Pairwise AUC comparison
+            if num_programs > 1:
+                with st.expander("### AUC comparison (DeLong test)"):
+                    st.markdown(
+                        """
+                        The DeLong test checks whether two programs have the same ROC AUC on the same compounds,
+                        taking into account that their scores are correlated. Small p-values (e.g. below 0.05)
+                        mean the difference between the AUCs is significant.
+
+                        The programs must score the same ligands and decoys: fill in the optional **id** columns
+                        to match the compounds by id, otherwise they are matched by their position.
+                        """
+                    )
+                    # the ids align the compounds, so editing them also makes the comparison stale
+                    comparison_key = tuple((program.name, program.data_hash, program.ids_hash)
+                                           for program in programs_expanders.programs)
+                    if st.button("⚖️ Compare AUCs", key="compare_aucs", type='secondary'):
+                        try:
+                            st.session_state['auc_comparison'] = (comparison_key, programs_expanders.compare_aucs())
+                        except ValueError as error:
+                            st.error(f"The programs could not be compared. {error}")
+
+                    comparison = st.session_state.get('auc_comparison')
+                    if comparison is not None and comparison[0] == comparison_key:
+                        result = comparison[1]
+                        st.caption(f"{result['n_ligands']} ligands and {result['n_decoys']} decoys scored by every program")
+                        st.dataframe(pd.DataFrame({"AUC": result["aucs"], "Standard error": result["se"]}).style.format("{:.3f}"))
+                        st.markdown("p-values")
+                        st.dataframe(result["pvalues"].style.format("{:.3g}").background_gradient(cmap="Greens_r", vmin=0, vmax=0.1))
 
 
 
@@ -190,26 +287,21 @@ if programs_expanders.all_data_generated():
             precision_recall.render()
             _, pr_download_col, _ = st.columns([1, 2, 1])
             st.write("")
-            download_btn = pr_download_col.download_button(
-                label="📥 Download chart",
-                data=downloader.read_image(downloader.download(precision_recall)),
-                file_name="precision_recall.png",
-                mime="image/png",
-                use_container_width=True,
-                key="pr_download"
-            )
+            chart_download_button(pr_download_col, downloader, precision_recall, "precision_recall.png", "pr_download", pending_downloads)
             info.precision_recall_interpretation_help()
 
+        await_download_buttons(pending_downloads)
+
     # Save checkpoint
     with save_cp_container:
         if save_button:
-            with open("checkpoint.pkl", "wb") as f:
-                pickle.dump(programs_expanders.to_dict(), f)
+            checkpoint = write_checkpoint(programs_expanders.to_dict(),
+                                          settings=st.session_state.get('curves_settings'))
             st.success("✔️ Checkpoint saved successfully.")
             download_button = download_col.download_button(
                 label="📥 Download",
-                data=open("checkpoint.pkl", "rb"),
-                file_name="checkpoint.pkl",
+                data=checkpoint,
+                file_name=f"checkpoint.{CHECKPOINT_EXTENSION}",
                 mime="application/octet-stream",
                 key="download_checkpoint",
                 use_container_width=True
@@ -224,21 +316,30 @@ if programs_expanders.all_data_generated():
         send_button = st.button("📨 Send", key="send", type='primary', help="Send the figures to the email")
         if send_button:
             if email:
-                # Loading bar
-                progress_bar = st.progress(0)
-                paths = [downloader.download(pc), downloader.download(roc), downloader.download(precision_recall)]
-                progress_bar.progress(0.3)
-                sender = EmailSender("smtp.gmail.com", 587)
-                progress_bar.progress(0.7)
-                result = sender.send_email_with_images(
-                    email, "PyDockStats figures", paths
-                )
-                progress_bar.progress(1)
-                if result['status'] == "success":
-                    st.success(result['message'])
-                    progress_bar.empty()
-                else:
-                    st.error(f"Email not sent. {result['message']}")
+                # the charts are rendered and the email is sent in the background
+                futures = [downloader.submit(pc), downloader.submit(roc), downloader.submit(precision_recall)]
+                images = list(zip(("pc.png", "roc.png", "precision_recall.png"), futures))
+                st.session_state['email_job'] = email_queue().submit(email, "PyDockStats figures", images)
             else:
                 st.error("Please enter an email address.")
 
+        email_job = st.session_state.get('email_job')
+        if email_job is not None:
+            if not email_job.done:
+                # polled on the reruns below, so the script never waits for the server
+                st.progress(email_job.progress, text=email_job.message)
+                email_pending = True
+            elif email_job.succeeded:
+                st.success(email_job.message)
+                del st.session_state['email_job']
+            else:
+                st.error(f"Email not sent. {email_job.message}")
+                del st.session_state['email_job']
+
+if performance_container is not None:
+    performance_panel(performance_container)
+
+# Rerun the app until the queued email is sent, to update its status
+if email_pending:
+    time.sleep(EMAIL_POLL_INTERVAL)
+    st.rerun()
@@ -0,0 +1,203 @@
+"""
+Headless batch evaluation of docking result files.
+
+Every result file holds one screen, with the scores in the first column and the
+activity (1 for ligands, 0 for decoys) in the second, as read by
+``model.pydockstats.read``. Example:
+
+    python src/cli.py "results/*.csv" --ef 0.01 0.05 --output summary.csv --curves curves.parquet
+"""
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from model.bootstrap import DEFAULT_RESAMPLES
+from model.calibration import CALIBRATIONS
+from model.pydockstats import calculate_curves, preprocess_data, read
+from model.streaming import DEFAULT_BINS, calculate_streaming_curves
+from utils import profiling
+
+# .lst files are single-column score lists, without the activity column
+RESULT_EXTENSIONS = (".csv", ".txt", ".xlsx", ".ods")
+WRITERS = {
+    ".csv": lambda df, path: df.to_csv(path, index=False),
+    ".parquet": lambda df, path: df.to_parquet(path, index=False),
+    ".json": lambda df, path: df.to_json(path, orient="records", indent=2),
+}
+
+
+def find_result_files(patterns):
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+            matches = [path for path in matches if path.endswith(RESULT_EXTENSIONS)]
+        else:
+            matches = glob.glob(pattern)
+        files.extend(sorted(matches))
+
+    return list(dict.fromkeys(files))
+
+
+def ef_column(cutoff):
+    return f"ef_{cutoff * 100:g}%"
+
+
+def evaluate_file(path, ef_cutoffs, calibration="sklearn", with_curves=False, n_bins=None, fit_bins=None,
+                  n_resamples=0):
+    """
+    Computes the metrics of one result file.
+
+    With ``n_bins``, the file is streamed into a score histogram instead of
+    being loaded, and the summary also reports the approximation bounds.
+    Otherwise ``fit_bins`` optionally fits the logistic calibration on score bins,
+    and ``n_resamples`` bootstrap replicates give the confidence intervals.
+
+    Returns:
+        A summary row (dict) and, if ``with_curves``, the curves as a long-format DataFrame.
+    """
+    if n_bins:
+        curves = calculate_streaming_curves([path], n_bins, ef_cutoffs=ef_cutoffs)
+        approximation = curves["approximation"]
+        n_compounds, n_actives = approximation["n_compounds"], approximation["n_actives"]
+    else:
+        scores, activity = preprocess_data(read(path))
+        curves = calculate_curves(path, scores, activity, calibration, ef_cutoffs=ef_cutoffs,
+                                  n_resamples=n_resamples, n_bins=fit_bins)
+        n_compounds, n_actives = len(activity), int(activity.sum())
+
+    pc, roc, pr = curves["pc"], curves["roc"], curves["precision_recall"]
+    summary = {
+        "file": path,
+        "n_compounds": n_compounds,
+        "n_actives": n_actives,
+        "auc": roc["auc"],
+        "bedroc": roc["bedroc"],
+    }
+    summary.update({ef_column(cutoff): ef for cutoff, ef in pc["ef_cutoffs"].items()})
+
+    # 95% bootstrap confidence intervals (with --resamples, not available when streaming)
+    if "auc_ci" in roc:
+        summary["auc_ci_low"], summary["auc_ci_high"] = roc["auc_ci"]
+        summary["bedroc_ci_low"], summary["bedroc_ci_high"] = roc["bedroc_ci"]
+        for cutoff, (low, high) in pc["ef_cutoffs_ci"].items():
+            summary[f"{ef_column(cutoff)}_ci_low"], summary[f"{ef_column(cutoff)}_ci_high"] = low, high
+
+    if n_bins:
+        summary["auc_error_bound"] = approximation["auc_error_bound"]
+        summary["bedroc_low"], summary["bedroc_high"] = approximation["bedroc_bounds"]
+        for cutoff, (low, high) in approximation["ef_bounds"].items():
+            summary[f"{ef_column(cutoff)}_low"], summary[f"{ef_column(cutoff)}_high"] = low, high
+
+    if not with_curves:
+        return summary, None
+
+    frames = [
+        pd.DataFrame({"curve": "pc", "x": pc["x"], "y": pc["y"], "ef": pc["efs"]}),
+        pd.DataFrame({"curve": "roc", "x": roc["x"], "y": roc["y"], "threshold": roc["thresholds"]}),
+        # precision and recall have one more point than the thresholds
+        pd.DataFrame({"curve": "precision_recall", "x": pr["x"][:-1], "y": pr["y"][:-1],
+                      "threshold": pr["thresholds"]}),
+    ]
+    curves_df = pd.concat(frames, ignore_index=True)
+    curves_df.insert(0, "file", path)
+
+    return summary, curves_df
+
+
+def _evaluate(args):
+    path, ef_cutoffs, calibration, with_curves, n_bins, fit_bins, n_resamples = args
+    try:
+        return evaluate_file(path, ef_cutoffs, calibration, with_curves, n_bins, fit_bins, n_resamples), None
+    except Exception as e:
+        return None, f"{path}: {e}"
+
+
+def write_table(df, path):
+    if path is None:
+        df.to_csv(sys.stdout, index=False)
+        return
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Invalid output format '{extension}'")
+    WRITERS[extension](df, path)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pydockstats",
+                                     description="Evaluate Virtual Screening result files without the web app.")
+    parser.add_argument("inputs", nargs="+", help="Result files, directories or glob patterns")
+    parser.add_argument("--ef", nargs="+", type=float, default=[0.01, 0.05, 0.1], metavar="FRACTION",
+                        help="Top fractions at which to report the enrichment factor (default: 0.01 0.05 0.1)")
+    parser.add_argument("-o", "--output", help="Summary table (.csv, .parquet or .json). Defaults to CSV on stdout")
+    parser.add_argument("--curves", help="Optional long-format table with the PC, ROC and precision-recall curves")
+    parser.add_argument("--calibration", default="sklearn", choices=["sklearn", *CALIBRATIONS],
+                        help="Score to probability mapping (default: sklearn)")
+    parser.add_argument("--fit-bins", type=int, metavar="N",
+                        help="Fit the logistic calibration on N equal-width score bins instead of every score "
+                             "(approximate and faster; requires --calibration logistic)")
+    parser.add_argument("--resamples", type=int, default=0, metavar="N",
+                        help="Bootstrap replicates of the 95%% confidence intervals of the AUC, BEDROC and EFs, "
+                             f"e.g. {DEFAULT_RESAMPLES} (default: 0, no intervals; ignored when streaming)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Stream the files into a score histogram instead of loading them (approximate, "
+                             "for screens that do not fit in memory; always uses the logistic calibration)")
+    parser.add_argument("--bins", type=int, default=DEFAULT_BINS,
+                        help=f"Number of score bins in streaming mode (default: {DEFAULT_BINS})")
+    parser.add_argument("--profile", nargs="?", const="time", choices=["time", "memory"],
+                        help="Log the time (and with 'memory', the tracemalloc peak) of each stage as JSON "
+                             "lines on stderr")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.fit_bins and args.calibration != "logistic":
+        parser.error("--fit-bins requires --calibration logistic")
+
+    if args.profile:
+        # set in the environment as well, so the worker processes profile too
+        os.environ[profiling.PROFILE_ENV] = args.profile
+        profiling.enable(memory=args.profile == "memory")
+
+    files = find_result_files(args.inputs)
+    if not files:
+        print("No result files found.", file=sys.stderr)
+        return 1
+
+    n_bins = args.bins if args.streaming else None
+    tasks = [(path, args.ef, args.calibration, args.curves is not None, n_bins, args.fit_bins, args.resamples)
+             for path in files]
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(files)))) as executor:
+        results = list(executor.map(_evaluate, tasks))
+
+    summaries, curves, errors = [], [], []
+    for result, error in results:
+        if error:
+            errors.append(error)
+            continue
+        summary, curves_df = result
+        summaries.append(summary)
+        if curves_df is not None:
+            curves.append(curves_df)
+
+    for error in errors:
+        print(f"Skipped {error}", file=sys.stderr)
+
+    if summaries:
+        write_table(pd.DataFrame(summaries), args.output)
+    if curves:
+        write_table(pd.concat(curves, ignore_index=True), args.curves)
+
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,10 @@
+from abc import ABC, abstractmethod
+import numpy as np
 import streamlit as st
 import plotly.graph_objects as go
 from components.program import Program
+from utils.downsampling import DEFAULT_MAX_POINTS, downsample_indices
+from utils.profiling import stage
 from typing import List, Dict
 
 HEX_COLORS = [
@@ -13,9 +17,15 @@ HEX_COLORS = [
 ]
 
 
-class Chart:
-    def __init__(self, name, title, xaxis_title, yaxis_title, show_xspikes=False):
+class Chart(ABC):
+    """
+    Base Plotly chart. Every curve is downsampled to at most ``max_points``
+    points (None keeps them all) before it is sent to the browser; the exact
+    values stay in the ``Program``.
+    """
+    def __init__(self, name, title, xaxis_title, yaxis_title, show_xspikes=False, max_points=DEFAULT_MAX_POINTS):
         self.programs: List[Program] = []
+        self.max_points = max_points
         self.curves: List[go.Scatter] = []
         self.name = name
         self.xaxis_title = xaxis_title
@@ -38,13 +48,73 @@ class Chart:
         self.__fig.update_layout(xaxis_title_font_size=20, yaxis_title_font_size=20, legend_font_size=15)
 
         self._color_palette = HEX_COLORS
+        self._background: List[go.Scatter] = []
+        self.__synced: Dict[str, tuple] = {}
         
+    def downsample(self, x, y, customdata):
+        """Returns the points of the curve (and their hover data) that are plotted."""
+        idx = downsample_indices(x, y, self.max_points)
+
+        # e.g. precision-recall has one threshold less than points
+        customdata = np.asarray(customdata, dtype=float)
+        customdata = np.r_[customdata, np.full(len(x) - len(customdata), np.nan)]
+
+        return np.asarray(x)[idx], np.asarray(y)[idx], customdata[idx]
+
     def add_trace(self, curve: go.Scatter) -> None:
         self.__fig.add_trace(curve)
 
     def add_program(self, program: Program) -> None:
         self.programs.append(program)
 
+    @abstractmethod
+    def make_curve(self, program: Program, color: str) -> go.Scatter:
+        """The trace of the program's curve, drawn in ``color``."""
+
+    def background_traces(self, programs: List[Program]) -> List[go.Scatter]:
+        """Traces drawn behind the program curves (reference lines)."""
+        return list(self._background)
+
+    def add_plot(self, program: Program):
+        with stage("add_plot", chart=self.name, program=program.name):
+            curve = self.make_curve(program, self._color_palette[len(self.curves)])
+
+            self.curves.append(curve)
+            self.add_trace(curve)
+
+        self.add_program(program)
+
+    def sync(self, programs: List[Program]) -> bool:
+        """
+        Makes the figure plot ``programs``, rebuilding only the curves of the
+        programs whose data (``Program.data_hash``) or position changed, and
+        dropping the curves of removed programs.
+
+        Returns:
+            True if the figure changed.
+        """
+        synced = {}
+        changed = [program.name for program in programs] != [program.name for program in self.programs]
+
+        for i, program in enumerate(programs):
+            key = (program.data_hash, i)
+            cached = self.__synced.get(program.name)
+            if cached is None or cached[0] != key:
+                with stage("add_plot", chart=self.name, program=program.name):
+                    cached = (key, self.make_curve(program, self._color_palette[i]))
+                changed = True
+            synced[program.name] = cached
+
+        self.__synced = synced
+        if changed:
+            with stage("build_figure", chart=self.name):
+                self.programs = list(programs)
+                self.curves = [curve for _, curve in synced.values()]
+                self.__fig.data = []
+                self.__fig.add_traces(self.background_traces(self.programs) + self.curves)
+
+        return changed
+
     def get_figure(self) -> go.Figure:
         return self.__fig
 
@@ -56,75 +126,71 @@ class Chart:
 
 
 class Predictiveness(Chart):
-    def __init__(self):
-        super().__init__("PC", "Predictiveness Curve", "Quantile", "Activity probability", show_xspikes=True)
+    def __init__(self, max_points=DEFAULT_MAX_POINTS):
+        super().__init__("PC", "Predictiveness Curve", "Quantile", "Activity probability", show_xspikes=True,
+                         max_points=max_points)
 
-    def add_plot(self, program: Program):
-        x, y = program.quantiles, program.probabilities
+    def make_curve(self, program: Program, color: str) -> go.Scatter:
+        x, y, efs = self.downsample(program.quantiles, program.probabilities, program.enrichment_factors)
 
         legend_title = f"{program.name}"
         hover = 'Quantile: %{x:.2f}<br>Activity probability: %{y:.2f}<br>Enrichment Factor: %{customdata:.3f}'
 
-        curve = go.Scatter(x=x, y=y, mode='lines', name=legend_title, line=dict(width=3, color=self._color_palette[len(self.curves)]),
-                            showlegend=True, hovertemplate=hover,
-                            customdata=program.enrichment_factors,
-                            legendgroup=program.name)
-
-        self.curves.append(curve)
-        self.add_trace(curve)
-
-        self.add_program(program)
+        return go.Scatter(x=x, y=y, mode='lines', name=legend_title, line=dict(width=3, color=color),
+                          showlegend=True, hovertemplate=hover,
+                          customdata=efs,
+                          legendgroup=program.name)
 
+    def prevalence_line(self, programs: List[Program]) -> go.Scatter:
+        prevalence = sum([program.prevalence for program in programs]) / len(programs)
+        return go.Scatter(x=[0, 1], y=[prevalence, prevalence], mode='lines', name='Prevalence',
+                          line=dict(width=1, color='gray', dash='dash'), showlegend=True, hoverinfo='skip')
 
     def add_prevalence_line(self, programs: List[Program]):
-        prevalence = sum([program.prevalence for program in programs]) / len(programs)
-        prevalence_line = go.Scatter(x=[0, 1], y=[prevalence, prevalence], mode='lines', name='Prevalence',
-                                     line=dict(width=1, color='gray', dash='dash'), showlegend=True, hoverinfo='skip')
-        self.add_trace(prevalence_line)
+        self.add_trace(self.prevalence_line(programs))
+
+    def background_traces(self, programs: List[Program]) -> List[go.Scatter]:
+        return [self.prevalence_line(programs)] if programs else []
 
 
 class ReceiverOperatingCharacteristic(Chart):
-    def __init__(self):
-        super().__init__("ROC", "Receiver Operating Characteristic (ROC)", "False Positive Rate", "True Positive Rate")        
+    def __init__(self, max_points=DEFAULT_MAX_POINTS):
+        super().__init__("ROC", "Receiver Operating Characteristic (ROC)", "False Positive Rate", "True Positive Rate",
+                         max_points=max_points)
         # add a diagonal line
         random_line = go.Scatter(x=[0, 1], y=[0, 1], mode='lines', name='Random', line=dict(width=1, color='red', dash='dash'),
                                  showlegend=True, hoverinfo='skip')
+        self._background.append(random_line)
         self.add_trace(random_line)
        
 
-    def add_plot(self, program: Program):
-        x, y = program.fpr, program.tpr
+    def make_curve(self, program: Program, color: str) -> go.Scatter:
+        x, y, thresholds = self.downsample(program.fpr, program.tpr, program.thresholds)
         
         legend_title = f"{program.name}: <br><b>AUC={program.auc:.3f}</b>"
+        low, high = program.auc_ci
+        if not np.isnan(low):
+            legend_title += f" [{low:.3f}, {high:.3f}]"
         hover = 'False Positive Rate: %{x:.3f}<br>True Positive Rate: %{y:.3f}<br>Threshold=%{customdata:.3f}'
 
-        curve = go.Scatter(x=x, y=y, mode='lines', name=legend_title, line=dict(width=3, color=self._color_palette[len(self.curves)]),
-                            showlegend=True, hovertemplate=hover,
-                            customdata=program.thresholds,
-                            legendgroup=program.name)
-        
-        self.curves.append(curve)
-        self.add_trace(curve)
-
-        self.add_program(program)
+        return go.Scatter(x=x, y=y, mode='lines', name=legend_title, line=dict(width=3, color=color),
+                          showlegend=True, hovertemplate=hover,
+                          customdata=thresholds,
+                          legendgroup=program.name)
 
 
 #  create precision-recall curve
 class PrecisionRecall(Chart):
-    def __init__(self):
-        super().__init__("Precision-Recall", "Precision-Recall Curve", "Recall", "Precision")
+    def __init__(self, max_points=DEFAULT_MAX_POINTS):
+        super().__init__("Precision-Recall", "Precision-Recall Curve", "Recall", "Precision", max_points=max_points)
 
-    def add_plot(self, program: Program):
-        x, y = program.recall, program.precision
+    def make_curve(self, program: Program, color: str) -> go.Scatter:
+        x, y, thresholds = self.downsample(program.recall, program.precision, program.pr_thresholds)
 
         legend_title = f"{program.name}"
         hover = 'Recall: %{x:.3f}<br>Precision: %{y:.3f}<br>Threshold=%{customdata:.3f}'
 
-        curve = go.Scatter(x=x, y=y, mode='lines', name=legend_title, line=dict(width=3, color=self._color_palette[len(self.curves)]),
-                            showlegend=True, hovertemplate=hover, 
-                            customdata=program.pr_thresholds,
-                            legendgroup=program.name)
-        self.curves.append(curve)
-        self.add_trace(curve)
-
-        self.add_program(program)
\ No newline at end of file
+        return go.Scatter(x=x, y=y, mode='lines', name=legend_title, line=dict(width=3, color=color),
+                          showlegend=True, hovertemplate=hover, 
+                          customdata=thresholds,
+                          legendgroup=program.name)
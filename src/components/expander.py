@@ -1,7 +1,28 @@
+import os
+import hashlib
 import streamlit as st
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from components.program import Program
-from typing import List, Dict
+from utils.loading import parse_scores, parse_ids
+from model.delong import compare_aucs
+from model.pydockstats import iter_curves_batch
+from model.cache import CURVES_CACHE, curves_key
+from typing import Callable, List, Dict, Optional
+
+MAX_REPORTED_ROWS = 10
+
+
+def editor_hash(*frames: pd.DataFrame) -> str:
+    """Content hash of the data editors, index included."""
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(pd.util.hash_pandas_object(frame, index=True).values.tobytes())
+        # separates the editors, so moving a row from one to the other changes the hash
+        digest.update(b"|")
+    return digest.hexdigest()
+
 
 class ProgramExpander:
     count = 1
@@ -11,6 +32,7 @@ class ProgramExpander:
         self.__program = program
         self.expand = expand
         self.__remove_button = None
+        self.__content_hash = None
 
     @property
     def program(self) -> Program:
@@ -38,6 +60,9 @@ class ProgramExpander:
                                                     width=300, column_config={
                                                         'score': st.column_config.Column(
                                                             "Scores of the ligands"
+                                                        ),
+                                                        'id': st.column_config.TextColumn(
+                                                            "Ligand ids (optional)"
                                                         )
                                                     })
             ligands_df = ligand_data_editor
@@ -49,6 +74,9 @@ class ProgramExpander:
                                                 width=300, column_config={
                                                     'score': st.column_config.Column(
                                                         "Scores of the decoys"
+                                                    ),
+                                                    'id': st.column_config.TextColumn(
+                                                        "Decoy ids (optional)"
                                                     )
                                                 })
             decoys_df = decoy_data_editor
@@ -57,17 +85,34 @@ class ProgramExpander:
             st.warning("Please fill in all the scores")
             return
         
-        # convert string to float (if there is a comma, convert to dot and then to float)
-        ligands_df['score'] = ligands_df['score'].apply(lambda x: float(x.replace(',', '.')) if isinstance(x, str) else x)
-        decoys_df['score'] = decoys_df['score'].apply(lambda x: float(x.replace(',', '.')) if isinstance(x, str) else x)
+        # the scores are only parsed again when the content of an editor changes
+        content_hash = editor_hash(ligands_df, decoys_df)
+        if content_hash == self.__content_hash:
+            return
+
+        ligands_score, invalid_ligands = parse_scores(ligands_df['score'])
+        decoys_score, invalid_decoys = parse_scores(decoys_df['score'])
+        ligand_ids, missing_ligand_ids = parse_ids(ligands_df['id'])
+        decoy_ids, missing_decoy_ids = parse_ids(decoys_df['id'])
 
-        self.__program.set_data(ligands_df['score'], decoys_df['score'])
+        problems = (("Invalid ligands scores", invalid_ligands), ("Invalid decoys scores", invalid_decoys),
+                    ("Missing ligands ids", missing_ligand_ids), ("Missing decoys ids", missing_decoy_ids))
+        for problem, rows in problems:
+            if len(rows):
+                listed = ", ".join(str(row) for row in rows[:MAX_REPORTED_ROWS])
+                more = f" and {len(rows) - MAX_REPORTED_ROWS} more" if len(rows) > MAX_REPORTED_ROWS else ""
+                st.error(f"{problem} in rows {listed}{more}")
+        if any(len(rows) for _, rows in problems):
+            return
+
+        self.__program.set_data(ligands_score, decoys_score, ligand_ids, decoy_ids)
+        self.__content_hash = content_hash
     
     def data_inputted(self) -> bool:
         return self.__program.data_inputted
         
-    def generate(self):
-        self.__program.generate()
+    def generate(self, calibration="sklearn", n_bins=None, n_resamples=0):
+        self.__program.generate(calibration, n_bins, n_resamples)
 
 
 class ProgramsExpanders:
@@ -132,9 +177,87 @@ class ProgramsExpanders:
             return False
         return all([expander.program.data_generated for expander in self.__expanders])
 
-    def generate(self):
-        for expander in self.__expanders:
-            expander.generate()
+    def generate(self, calibration="sklearn", on_progress: Optional[Callable[[int, int, str], None]] = None,
+                 max_workers: Optional[int] = None, n_bins: Optional[int] = None, n_resamples: int = 0):
+        """
+        Generates the curves of every program in a thread pool.
+
+        Programs with the same number of ligands and of decoys share their
+        activity vector, so the ones that are not cached are computed together
+        by ``iter_curves_batch``; otherwise each program is generated on
+        its own. The programs keep their order, and ``on_progress(done, total,
+        name)`` is called from the calling thread each time a program finishes.
+        ``n_resamples`` bootstrap replicates give the confidence intervals (0 skips them).
+        """
+        expanders = list(self.__expanders)
+        if not expanders:
+            return
+
+        max_workers = max_workers or min(len(expanders), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            programs = [expander.program for expander in expanders]
+            if len(programs) > 1 and len({(len(program.ligand_scores), len(program.decoy_scores))
+                                          for program in programs}) == 1:
+                self.__generate_batch(programs, calibration, n_bins, n_resamples, executor, on_progress)
+                return
+
+            futures = {executor.submit(expander.generate, calibration, n_bins, n_resamples): expander
+                       for expander in expanders}
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                if on_progress:
+                    on_progress(done, len(futures), futures[future].program.name)
+
+    def __generate_batch(self, programs: List[Program], calibration, n_bins, n_resamples, executor,
+                         on_progress=None):
+        inputs = [program.inputs() for program in programs]
+        keys = [curves_key(scores, activity, calibration=calibration, n_bins=n_bins, n_resamples=n_resamples)
+                for scores, activity in inputs]
+        done = 0
+
+        def finished(program: Program):
+            nonlocal done
+            done += 1
+            if on_progress:
+                on_progress(done, len(programs), program.name)
+
+        # programs restored from their own curves or the cache are done right away
+        missing = []
+        for i, (program, key) in enumerate(zip(programs, keys)):
+            if program.restore(key):
+                finished(program)
+            else:
+                missing.append(i)
+        if not missing:
+            return
+
+        score_matrix = np.column_stack([inputs[i][0] for i in missing])
+        for column, program_curves in iter_curves_batch([programs[i].name for i in missing], score_matrix,
+                                                        inputs[0][1], calibration, n_resamples=n_resamples,
+                                                        executor=executor, n_bins=n_bins):
+            i = missing[column]
+            CURVES_CACHE.put(keys[i], program_curves)
+            programs[i].set_curves(program_curves, keys[i])
+            finished(programs[i])
+
+    def compare_aucs(self) -> dict:
+        """
+        Pairwise DeLong test of the ROC AUCs of all programs (see ``model.delong.compare_aucs``).
+
+        The compounds are aligned by id when every program has ids, and by
+        position otherwise.
+        """
+        programs = self.programs
+        with_ids = all(program.ligand_ids is not None and program.decoy_ids is not None for program in programs)
+
+        return compare_aucs(
+            [program.name for program in programs],
+            [program.ligand_scores for program in programs],
+            [program.decoy_scores for program in programs],
+            [program.ligand_ids for program in programs] if with_ids else None,
+            [program.decoy_ids for program in programs] if with_ids else None,
+        )
 
     def to_dict(self) -> Dict[str, Dict[str, pd.DataFrame]]:
         return {program.name: program.to_dict() for program in self.programs}
@@ -1,132 +1,252 @@
+import hashlib
+
+import numpy as np
 import pandas as pd
-from model.pydockstats import calculate_curves, preprocess_data
+from model.pydockstats import calculate_curves
+from model.cache import CURVES_CACHE, curves_key
+from model.results import Curves
+from utils.profiling import stage
+
+
+def scores_array(scores) -> np.ndarray:
+    """The scores as a float64 array; missing scores (no data yet) are a single NaN."""
+    if scores is None:
+        return np.array([np.nan])
+    return pd.to_numeric(pd.Series(scores), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def ids_array(ids) -> np.ndarray:
+    """The compound ids as a string array, or None without ids."""
+    if ids is None:
+        return None
+    return np.asarray(pd.Series(ids).astype(str))
+
+
+def ids_digest(*ids) -> str:
+    """Content hash of compound id arrays (None for a missing array)."""
+    digest = hashlib.sha256()
+    for values in ids:
+        if values is None:
+            digest.update(b"none")
+        else:
+            # the ids are an object array, whose bytes would be the addresses of the strings
+            digest.update(f"{len(values)}:".encode())
+            digest.update(pd.util.hash_array(np.asarray(values, dtype=object)).tobytes())
+    return digest.hexdigest()
+
+
+def scores_frame(scores, ids=None) -> pd.DataFrame:
+    # the data editors start with one empty row
+    if scores is None:
+        return pd.DataFrame(data=[{'score': None, 'id': None}], columns=['score', 'id'])
+    return pd.DataFrame({'score': scores, 'id': ids})
+
+
+def has_ids(df: pd.DataFrame) -> bool:
+    return 'id' in df and len(df) > 0 and df['id'].notna().all()
+
 
 class Program:
-    def __init__(self, name: str):
-        self.name = name        
-        self.__ligands = pd.DataFrame(data=[{'score': None}], columns=['score'])
-        self.__decoys = pd.DataFrame(data=[{'score': None}], columns=['score'])
+    """
+    A docking program with the scores of its ligands and decoys (optionally with
+    compound ids), and once generated, its curves.
 
-        self.__quantiles = None
-        self.__probabilities = None
-        self.__prevalence = None
-        self.__enrichment_factors = None
+    The scores are kept as float64 arrays and the curves in a single ``Curves``
+    buffer, since every program of every session lives in ``st.session_state``.
+    """
+    __slots__ = ("name", "__ligands", "__decoys", "__ligand_ids", "__decoy_ids", "__ids_hash", "__curves",
+                 "__data_hash", "data_generated", "data_inputted")
 
-        self.__fpr = None
-        self.__tpr = None
-        self.__auc = None
-        self.__thresholds = None
-        self.__bedroc = None
+    def __init__(self, name: str):
+        self.name = name
+        self.__ligands = None
+        self.__decoys = None
+        self.__ligand_ids = None
+        self.__decoy_ids = None
+        self.__ids_hash = ids_digest(None, None)
 
-        self.__recall = None
-        self.__precision = None
-        self.__pr_thresholds = None
+        self.__curves = None
+        self.__data_hash = None
 
         self.data_generated = False
         self.data_inputted = False
 
+    def __array(self, group, key):
+        return self.__curves.array(group, key) if self.__curves is not None else None
+
     @property
     def quantiles(self):
-        return self.__quantiles
+        return self.__array("pc", "x")
     
     @property
     def probabilities(self):
-        return self.__probabilities
+        return self.__array("pc", "y")
     
     @property
     def prevalence(self):
-        return self.__prevalence
+        return self.__curves.prevalence if self.__curves is not None else None
     
     @property
     def enrichment_factors(self):
-        return self.__enrichment_factors
+        return self.__array("pc", "efs")
     
     @property
     def fpr(self):
-        return self.__fpr
+        return self.__array("roc", "x")
     
     @property
     def tpr(self):
-        return self.__tpr
+        return self.__array("roc", "y")
     
     @property
     def auc(self):
-        return self.__auc
+        return self.__curves.auc if self.__curves is not None else None
     
     @property
     def bedroc(self):
-        return self.__bedroc
+        return self.__curves.bedroc if self.__curves is not None else None
+
+    @property
+    def auc_ci(self):
+        """95% bootstrap confidence interval of the AUC, as (low, high)."""
+        return self.__curves.auc_ci if self.__curves is not None else None
+
+    @property
+    def bedroc_ci(self):
+        """95% bootstrap confidence interval of the BEDROC, as (low, high)."""
+        return self.__curves.bedroc_ci if self.__curves is not None else None
 
     @property
     def recall(self):
-        return self.__recall
+        return self.__array("precision_recall", "x")
+
     @property
     def precision(self):
-        return self.__precision
+        return self.__array("precision_recall", "y")
     
     @property
     def thresholds(self):
-        return self.__thresholds
+        return self.__array("roc", "thresholds")
     
     @property
     def pr_thresholds(self):
-        return self.__pr_thresholds
+        return self.__array("precision_recall", "thresholds")
+
+    @property
+    def data_hash(self):
+        """Content hash of the data and parameters the curves were generated from."""
+        return self.__data_hash
+
+    @property
+    def ids_hash(self) -> str:
+        """Content hash of the ligand and decoy ids, which are not part of ``data_hash``."""
+        return self.__ids_hash
     
-    def set_data(self, ligands_score, decoys_score):
-        self.__ligands = pd.DataFrame(data=ligands_score, columns=['score'])
-        self.__decoys = pd.DataFrame(data=decoys_score, columns=['score'])
+    def set_data(self, ligands_score, decoys_score, ligand_ids=None, decoy_ids=None):
+        self.__ligands = scores_array(ligands_score)
+        self.__decoys = scores_array(decoys_score)
+        self.__ligand_ids = ids_array(ligand_ids)
+        self.__decoy_ids = ids_array(decoy_ids)
+        self.__ids_hash = ids_digest(self.__ligand_ids, self.__decoy_ids)
         self.data_inputted = True
 
     @property
     def ligands(self) -> pd.DataFrame:
-        return self.__ligands
+        return scores_frame(self.__ligands, self.__ligand_ids)
     
     @property
     def decoys(self) -> pd.DataFrame:
-        return self.__decoys
-    
-
-    def generate(self):
-        ligands_copy = self.__ligands.copy()
-        decoys_copy = self.__decoys.copy()
-
-        ligands_copy['activity'] = 1
-        decoys_copy['activity'] = 0
-
-        df = pd.concat([ligands_copy, decoys_copy], ignore_index=True)
-
-        scores, activity = preprocess_data(df)
+        return scores_frame(self.__decoys, self.__decoy_ids)
 
-        curves = calculate_curves(self.name, scores, activity)
-        
-        pc = curves['pc']
-        roc = curves['roc']
-        precision_recall = curves['precision_recall']
-
-        self.__quantiles = pc['x']
-        self.__probabilities = pc['y']
-        self.__prevalence = pc['avg_score']
-        self.__enrichment_factors = pc['efs']
+    @property
+    def ligand_scores(self) -> np.ndarray:
+        return scores_array(self.__ligands)
 
-        self.__fpr = roc['x']
-        self.__tpr = roc['y']
-        self.__auc = roc['auc']
-        self.__thresholds = roc['thresholds']
-        self.__bedroc = roc['bedroc']
+    @property
+    def decoy_scores(self) -> np.ndarray:
+        return scores_array(self.__decoys)
 
-        self.__recall = precision_recall['x']
-        self.__precision = precision_recall['y']
-        self.__pr_thresholds = precision_recall['thresholds']
+    @property
+    def ligand_ids(self) -> np.ndarray:
+        return self.__ligand_ids
 
+    @property
+    def decoy_ids(self) -> np.ndarray:
+        return self.__decoy_ids
+
+    def inputs(self):
+        """The scores and activity passed to ``calculate_curves``: the ligands, then the decoys."""
+        ligands, decoys = scores_array(self.__ligands), scores_array(self.__decoys)
+        scores = np.concatenate([ligands, decoys])
+        activity = np.r_[np.ones(len(ligands), dtype=np.int8), np.zeros(len(decoys), dtype=np.int8)]
+        return scores, activity
+
+    def restore(self, key: str) -> bool:
+        """
+        Uses the curves already computed for ``key`` (a ``curves_key``), if any.
+
+        Returns:
+            False if the curves must be computed.
+        """
+        # curves restored from a checkpoint are kept while the data is the same
+        if self.data_generated and key == self.__data_hash:
+            return True
+
+        # unchanged data is never recomputed, across reruns and sessions
+        curves = CURVES_CACHE.get(key)
+        if curves is None:
+            return False
+
+        self.set_curves(curves, key)
+        return True
+
+    def generate(self, calibration="sklearn", n_bins=None, n_resamples=0):
+        with stage("generate", program=self.name):
+            scores, activity = self.inputs()
+            with stage("hash", program=self.name):
+                key = curves_key(scores, activity, calibration=calibration, n_bins=n_bins,
+                                 n_resamples=n_resamples)
+            if self.restore(key):
+                return
+
+            curves = calculate_curves(self.name, scores, activity, calibration, n_resamples=n_resamples, n_bins=n_bins)
+            CURVES_CACHE.put(key, curves)
+
+            with stage("store", program=self.name):
+                self.set_curves(curves, key)
+
+    def set_curves(self, curves: dict, data_hash: str):
+        """
+        Sets the curves computed by ``calculate_curves``, together with the
+        ``curves_key`` of the data and parameters they were computed from.
+        """
+        self.__curves = curves if isinstance(curves, Curves) else Curves(curves)
+        self.__data_hash = data_hash
         self.data_generated = True
 
+    @property
+    def curves(self) -> dict:
+        """The curves in the layout returned by ``calculate_curves``."""
+        return self.__curves.to_dict()
+
     def to_dict(self):
-        return {
-            'ligands': self.__ligands,
-            'decoys': self.__decoys,
+        data = {
+            'ligands': self.ligands,
+            'decoys': self.decoys,
         }
+        if self.data_generated:
+            data['curves'] = self.curves
+            data['data_hash'] = self.__data_hash
+
+        return data
     
     def from_dict(self, data: dict):
-        self.__ligands = data['ligands']
-        self.__decoys = data['decoys']
-
+        self.__ligands = scores_array(data['ligands']['score'])
+        self.__decoys = scores_array(data['decoys']['score'])
+        self.__ligand_ids = ids_array(data['ligands'].get('id')) if has_ids(data['ligands']) else None
+        self.__decoy_ids = ids_array(data['decoys'].get('id')) if has_ids(data['decoys']) else None
+        self.__ids_hash = ids_digest(self.__ligand_ids, self.__decoy_ids)
+
+        # the curves are only used if generate() finds the same data hash
+        if data.get('curves') is not None:
+            self.set_curves(data['curves'], data['data_hash'])
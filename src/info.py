@@ -52,7 +52,7 @@ def general_help():
 
                     - Also, you can send the figures to your email on the bottom of the page.
 
-                    - Finally, you can save your progress using the **💾 Save progress** button on the sidebar and then download the checkpoint (.pkl). Later, you can **📁 Upload the checkpoint file**, **📤 Load** it and continue your analysis from where you left off.
+                    - Finally, you can save your progress using the **💾 Save progress** button on the sidebar and then download the checkpoint (.pdsz). Later, you can **📁 Upload the checkpoint file**, **📤 Load** it and continue your analysis from where you left off.
                     """)
         
 def pc_interpretation_help():
@@ -0,0 +1,155 @@
+import numpy as np
+from utils.calcs import RankingContext, _bedroc_from_sum, exp_rank_sum, pro_rata_top_actives
+
+# Constants
+DEFAULT_RESAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 0
+# memory used by one batch of replicates
+DEFAULT_MAX_MEMORY = 256 * 2 ** 20
+# float64 arrays of one replicate row kept alive at the same time
+ARRAYS_PER_REPLICATE = 8
+
+
+class StratifiedBootstrap:
+    """
+    Stratified bootstrap of the metrics of a ``RankingContext``: every replicate
+    draws the actives and the decoys separately, with replacement, so the number
+    of actives stays the same.
+
+    A resample never changes the order of the compounds, so the ranking is
+    sorted once. It is cut into segments: each tie group holding actives, and
+    the runs of decoys between them. A replicate is then just how many resampled
+    actives and decoys fall in each segment, which is a pair of multinomial
+    draws over ``2 * (number of active groups) + 1`` segments, however many
+    decoys the screen has. The metrics of all replicates of a batch are
+    computed at once from these counts:
+
+    - AUC: every active beats the decoys of the segments below it and ties with
+      the decoys of its own segment.
+    - BEDROC: the actives of a segment are spread evenly over its ranks and the
+      sum of ``exp(-alpha * rank / n)`` over those ranks is a geometric series
+      (``utils.calcs.exp_rank_sum``).
+    - EF: the actives above a cutoff come from the cumulative counts, with the
+      segment the cutoff falls in counted pro rata
+      (``utils.calcs.pro_rata_top_actives``).
+
+    The streaming ``HistogramRanking`` uses the same two helpers for its bins.
+
+    Ties: the replicate BEDROC and EF spread the actives of a tie group evenly
+    over its ranks, which is their average over every order of the tied
+    compounds. The point estimates of ``RankingContext`` keep a single order
+    (the reverse of the input order), so on heavily tied scores the intervals
+    are centred on the tie-averaged values and may not contain the point
+    estimate. The AUC counts ties as one half in both, so it is not affected.
+
+    Args:
+        ranking: The ranking of the original sample.
+    """
+
+    def __init__(self, ranking: RankingContext):
+        self.n = ranking.n
+        self.n_actives = ranking.n_actives
+        self.n_decoys = ranking.n - ranking.n_actives
+
+        group_actives = np.diff(np.r_[0, ranking.tps])
+        group_decoys = np.diff(np.r_[0, ranking.fps])
+        active_groups = np.flatnonzero(group_actives)
+
+        # decoys of the groups between two active groups are merged into one segment
+        decoys_before = np.r_[0, ranking.fps][active_groups] - np.r_[0, ranking.fps[active_groups]][:-1]
+        trailing_decoys = ranking.fps[-1] - (ranking.fps[active_groups[-1]] if len(active_groups) else 0)
+
+        self.segment_actives = np.zeros(2 * len(active_groups) + 1)
+        self.segment_decoys = np.zeros(2 * len(active_groups) + 1)
+        self.segment_actives[1::2] = group_actives[active_groups]
+        self.segment_decoys[1::2] = group_decoys[active_groups]
+        self.segment_decoys[0:-1:2] = decoys_before
+        self.segment_decoys[-1] = trailing_decoys
+
+    def batch_size(self, max_memory=DEFAULT_MAX_MEMORY) -> int:
+        """The number of replicates that fit in ``max_memory`` bytes."""
+        return max(1, int(max_memory // (len(self.segment_actives) * ARRAYS_PER_REPLICATE * 8)))
+
+    def resample(self, n_resamples, rng: np.random.Generator):
+        """The segment counts of ``n_resamples`` replicates (one row each)."""
+        actives = rng.multinomial(self.n_actives, self.segment_actives / max(self.n_actives, 1), size=n_resamples)
+        decoys = rng.multinomial(self.n_decoys, self.segment_decoys / max(self.n_decoys, 1), size=n_resamples)
+        return actives.astype(float), decoys.astype(float)
+
+    def metrics(self, actives, decoys, ef_cutoffs=(), alpha=20.0):
+        """
+        The AUC, BEDROC and EFs of each row of segment counts.
+
+        Returns:
+            The AUCs, the BEDROCs and an array with one column per EF cutoff.
+        """
+        sizes = actives + decoys
+        ends = np.cumsum(sizes, axis=1)
+        starts = ends - sizes
+
+        # actives beat the decoys below them and tie with the decoys of their segment
+        decoys_below = self.n_decoys - np.cumsum(decoys, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            aucs = np.sum(actives * (decoys_below + 0.5 * decoys), axis=1) / (self.n_actives * self.n_decoys)
+
+            share = np.divide(actives, sizes, out=np.zeros_like(actives), where=sizes > 0)
+            rank_sums = exp_rank_sum(starts, ends, self.n, alpha)
+            bedrocs = _bedroc_from_sum(np.sum(share * rank_sums, axis=1), self.n_actives, self.n, alpha)
+
+            cutoffs = (self.n * np.asarray(ef_cutoffs, dtype=float)).astype(int)
+            top_actives = pro_rata_top_actives(cutoffs, actives, sizes)[0]
+            efs = (top_actives / self.n_actives) / (cutoffs / self.n)
+
+        return aucs, bedrocs, efs
+
+    def replicates(self, n_resamples=DEFAULT_RESAMPLES, ef_cutoffs=(), alpha=20.0, seed=DEFAULT_SEED,
+                   max_memory=DEFAULT_MAX_MEMORY):
+        """The AUC, BEDROC and EFs of ``n_resamples`` replicates, drawn in batches."""
+        rng = np.random.default_rng(seed)
+        batch = self.batch_size(max_memory)
+
+        results = []
+        for start in range(0, n_resamples, batch):
+            actives, decoys = self.resample(min(batch, n_resamples - start), rng)
+            results.append(self.metrics(actives, decoys, ef_cutoffs, alpha))
+
+        aucs, bedrocs, efs = zip(*results)
+        return np.concatenate(aucs), np.concatenate(bedrocs), np.concatenate(efs)
+
+
+def bootstrap_intervals(ranking: RankingContext, n_resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE,
+                        ef_cutoffs=(), alpha=20.0, seed=DEFAULT_SEED, max_memory=DEFAULT_MAX_MEMORY):
+    """
+    Percentile bootstrap confidence intervals of the AUC, the BEDROC and the
+    enrichment factors of a ranking (see ``StratifiedBootstrap``, also for how
+    tied scores are handled).
+
+    Args:
+        ranking: The ranking of the predictions.
+        n_resamples: The number of bootstrap replicates.
+        confidence: The confidence level of the intervals.
+        ef_cutoffs: Top fractions at which to give the EF interval.
+        alpha: The early recognition parameter of the BEDROC.
+        seed: Seed of the resampling, so the same data always gives the same intervals.
+        max_memory: Bytes used by one batch of replicates.
+
+    Returns:
+        A dictionary with the (low, high) "auc" and "bedroc" intervals, and the
+        "ef" intervals by cutoff.
+    """
+    if ranking.n_actives == 0 or ranking.n_actives == ranking.n:
+        raise ValueError("The bootstrap needs both actives and decoys")
+
+    aucs, bedrocs, efs = StratifiedBootstrap(ranking).replicates(n_resamples, ef_cutoffs, alpha, seed, max_memory)
+    tails = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+
+    def interval(values):
+        low, high = np.percentile(values, tails)
+        return float(low), float(high)
+
+    return {
+        "auc": interval(aucs),
+        "bedroc": interval(bedrocs),
+        "ef": {cutoff: interval(efs[:, j]) for j, cutoff in enumerate(ef_cutoffs)},
+    }
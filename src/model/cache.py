@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from utils.lru import DiskLRU, MemoryLRU
+
+# Bump when a change to the metrics makes previously cached curves stale
+CACHE_VERSION = 2
+MEMORY_ENTRIES = 64
+# arrays kept by the memory tier; a float64 result of 1M compounds takes about 50 MB
+MEMORY_BYTES = 512 * 2 ** 20
+DISK_ENTRIES = 1024
+# dicts of the curves keyed by the EF cutoff (a float)
+FLOAT_KEYED = ("ef_cutoffs", "ef_cutoffs_ci")
+
+
+def curves_key(scores, activity, **params) -> str:
+    """
+    Content hash of the inputs of ``calculate_curves``: the score and activity
+    arrays plus every calibration or metric parameter.
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(scores, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(activity, dtype=np.int8).tobytes())
+    digest.update(json.dumps(dict(params, version=CACHE_VERSION), sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def flatten(curves: dict, prefix: str = "") -> dict:
+    """Flattens nested curve dicts into ``{"roc/x": array, ...}``."""
+    flat = {}
+    for key, value in curves.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}/"))
+        else:
+            flat[f"{prefix}{key}"] = np.asarray(value)
+    return flat
+
+
+def unflatten(flat) -> dict:
+    """
+    Inverse of ``flatten``. Scalars come back as Python numbers, and the keys
+    of the ``FLOAT_KEYED`` dicts as floats.
+    """
+    curves = {}
+    for path, value in flat.items():
+        *parents, key = path.split("/")
+        node = curves
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        if parents and parents[-1] in FLOAT_KEYED:
+            key = float(key)
+        node[key] = value.item() if value.ndim == 0 else value
+    return curves
+
+
+def frozen(curves):
+    """
+    A copy of the nested curve dicts in which every array is read-only. Arrays
+    that are still writable are copied, the others are shared.
+    """
+    if isinstance(curves, dict):
+        return {key: frozen(value) for key, value in curves.items()}
+    if isinstance(curves, np.ndarray) and curves.flags.writeable:
+        curves = curves.copy()
+        curves.flags.writeable = False
+    return curves
+
+
+def curves_nbytes(curves) -> int:
+    if isinstance(curves, dict):
+        return sum(curves_nbytes(value) for value in curves.values())
+    return curves.nbytes if isinstance(curves, np.ndarray) else 0
+
+
+def load_curves(path) -> dict:
+    with np.load(path, allow_pickle=False) as data:
+        return unflatten({name: data[name] for name in data.files})
+
+
+class CurvesCache:
+    """
+    Two-tier cache of ``calculate_curves`` results keyed by ``curves_key``.
+
+    The memory tier is an LRU of at most ``max_entries`` results and
+    ``max_bytes`` bytes of arrays, shared by every session of the process. Its
+    arrays are read-only and every ``get`` returns new dicts, so a caller can
+    not change the results seen by the others. The optional disk tier stores
+    one compressed .npz per key in ``directory`` and evicts the least recently
+    used files beyond ``max_disk_entries``.
+    """
+
+    def __init__(self, max_entries=MEMORY_ENTRIES, directory=None, max_disk_entries=DISK_ENTRIES,
+                 max_bytes=MEMORY_BYTES):
+        self.directory = directory
+        self.__memory = MemoryLRU(max_entries, max_bytes, sizeof=curves_nbytes)
+        self.__disk = DiskLRU(directory, ".npz", max_disk_entries) if directory else None
+
+    def get(self, key):
+        curves = self.__memory.get(key)
+        if curves is not None:
+            return frozen(curves)
+
+        if self.__disk is None:
+            return None
+        curves = self.__disk.read(key, load_curves)
+        return self.__remember(key, curves) if curves is not None else None
+
+    def put(self, key, curves):
+        self.__remember(key, curves)
+
+        if self.__disk is not None:
+            self.__disk.write(key, lambda f: np.savez_compressed(f, **flatten(curves)))
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the arrays in the memory tier."""
+        return self.__memory.nbytes
+
+    def clear(self):
+        self.__memory.clear()
+
+    def __remember(self, key, curves):
+        curves = frozen(curves)
+        self.__memory.put(key, curves)
+        return frozen(curves)
+
+
+# Shared by every session; set PYDOCKSTATS_CACHE_DIR to also keep the results on disk
+CURVES_CACHE = CurvesCache(directory=os.environ.get("PYDOCKSTATS_CACHE_DIR"))
@@ -0,0 +1,189 @@
+import numpy as np
+from scipy.special import expit
+from sklearn.isotonic import isotonic_regression
+
+
+def group_scores(x, y):
+    """
+    Sufficient statistics of (score, activity) pairs grouped by unique score.
+
+    Args:
+        x: A numpy array of scores.
+        y: A numpy array of binary labels.
+
+    Returns:
+        The unique scores (ascending), the number of compounds and of actives
+        with each score, and the group index of every compound in ``x``.
+    """
+    order = np.argsort(x, kind='mergesort')
+    sorted_x = x[order]
+
+    # after the sort, grouping by unique score is a single O(N) pass
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_x)) + 1]
+    values = sorted_x[starts]
+    counts = np.diff(np.r_[starts, len(x)])
+    positives = np.add.reduceat(y[order], starts).astype(float)
+
+    inverse = np.empty(len(x), dtype=np.intp)
+    inverse[order] = np.repeat(np.arange(len(starts)), counts)
+
+    return values, counts, positives, inverse
+
+
+def bin_scores(x, y, n_bins):
+    """
+    Sufficient statistics of (score, activity) pairs in ``n_bins`` equal-width
+    score bins. Does not sort the scores.
+
+    Returns:
+        The mean score, the number of compounds and of actives of every
+        non-empty bin.
+    """
+    lo, hi = x.min(), x.max()
+    width = (hi - lo) / n_bins if hi > lo else 1.0
+    bins = np.minimum(((x - lo) / width).astype(np.intp), n_bins - 1)
+
+    counts = np.bincount(bins, minlength=n_bins)
+    positives = np.bincount(bins, weights=y, minlength=n_bins)
+    sums = np.bincount(bins, weights=x, minlength=n_bins)
+
+    filled = counts > 0
+    return sums[filled] / counts[filled], counts[filled], positives[filled]
+
+
+def newton_logistic(values, counts, positives, max_iter=100, tol=1e-10):
+    """
+    Unpenalized 1-D logistic regression fitted by Newton iterations on grouped
+    data, where ``positives[k]`` of the ``counts[k]`` compounds with score
+    ``values[k]`` are active.
+
+    Returns:
+        The intercept and the slope of the fitted model.
+    """
+    counts = counts.astype(float)
+
+    # standardize the scores so the Hessian is well conditioned
+    total = counts.sum()
+    mean = np.sum(counts * values) / total
+    std = np.sqrt(np.sum(counts * (values - mean) ** 2) / total) or 1.0
+    z = (values - mean) / std
+
+    def log_likelihood(theta):
+        eta = theta[0] + theta[1] * z
+        return np.sum(positives * eta - counts * np.logaddexp(0, eta))
+
+    prevalence = np.clip(positives.sum() / total, 1e-12, 1 - 1e-12)
+    theta = np.array([np.log(prevalence / (1 - prevalence)), 0.0])
+    current = log_likelihood(theta)
+
+    for _ in range(max_iter):
+        p = expit(theta[0] + theta[1] * z)
+        residual = positives - counts * p
+        weights = counts * p * (1 - p)
+
+        gradient = np.array([residual.sum(), np.sum(residual * z)])
+        hessian = np.array([[weights.sum(), np.sum(weights * z)],
+                            [np.sum(weights * z), np.sum(weights * z * z)]])
+        try:
+            step = np.linalg.solve(hessian, gradient)
+        except np.linalg.LinAlgError:
+            break
+
+        # halve the step until the likelihood does not decrease
+        scale = 1.0
+        while scale > 1e-8:
+            candidate = theta + scale * step
+            candidate_ll = log_likelihood(candidate)
+            if candidate_ll >= current:
+                break
+            scale /= 2
+        else:
+            break
+
+        theta, previous = candidate, current
+        current = candidate_ll
+        if np.max(np.abs(scale * step)) < tol or current - previous < tol * abs(current):
+            break
+
+    # back to the original score scale
+    slope = theta[1] / std
+    intercept = theta[0] - slope * mean
+    return intercept, slope
+
+
+def fit_logistic(x, y, n_bins=None):
+    """
+    Logistic calibration of the scores, fitted with Newton iterations on the
+    sufficient statistics of the data instead of every compound.
+
+    Args:
+        x: A numpy array of scores.
+        y: A numpy array of binary labels.
+        n_bins: When given, fit on ``n_bins`` equal-width score bins, which
+            skips the sort and is approximate. Otherwise the fit is exact and
+            uses one group per unique score.
+
+    Returns:
+        The activity probability of every compound.
+    """
+    if n_bins:
+        values, counts, positives = bin_scores(x, y, n_bins)
+    else:
+        values, counts, positives, _ = group_scores(x, y)
+
+    intercept, slope = newton_logistic(values, counts, positives)
+    return expit(intercept + slope * x)
+
+
+def pool_adjacent_violators(values, weights):
+    """
+    Non-decreasing least squares fit of ``values`` with the given weights.
+
+    Uses the compiled pool adjacent violators of scikit-learn, which is linear
+    in the number of values; ``fit_isotonic`` passes one value per distinct
+    score, so the cost is that of the sort in ``group_scores``.
+    """
+    return isotonic_regression(values, sample_weight=weights, increasing=True)
+
+
+def fit_isotonic(x, y):
+    """
+    Isotonic (pool adjacent violators) calibration of the scores.
+
+    The direction of the fit follows the sign of the score/activity
+    covariance, so it works whether lower or higher scores are better.
+
+    Returns:
+        The activity probability of every compound.
+    """
+    values, counts, positives, inverse = group_scores(x, y)
+    rates = positives / counts
+
+    increasing = np.sum((values - np.sum(counts * values) / counts.sum()) * positives) >= 0
+    if increasing:
+        fitted = pool_adjacent_violators(rates, counts.astype(float))
+    else:
+        fitted = pool_adjacent_violators(rates[::-1], counts[::-1].astype(float))[::-1]
+
+    return fitted[inverse]
+
+
+CALIBRATIONS = {"logistic": fit_logistic, "isotonic": fit_isotonic}
+
+
+def calibrate(x, y, method="logistic", **kwargs):
+    """
+    Maps the scores to activity probabilities with the selected calibration.
+
+    Args:
+        x: A numpy array of scores.
+        y: A numpy array of binary labels.
+        method: One of the keys of ``CALIBRATIONS``.
+
+    Returns:
+        The activity probability of every compound.
+    """
+    if method not in CALIBRATIONS:
+        raise ValueError(f"Invalid calibration '{method}'")
+
+    return CALIBRATIONS[method](np.asarray(x, dtype=float), np.asarray(y, dtype=float), **kwargs)
@@ -1,22 +1,41 @@
-import pandas as pd
 import numpy as np
-from sklearn.metrics import auc, precision_recall_curve, roc_curve
+from concurrent.futures import as_completed
+from sklearn.metrics import auc
 from sklearn.linear_model import LogisticRegression
-from utils.calcs import calculate_bedroc, calculate_enrichment_factor, bedroc_score
-from utils.putils import scale, num_derivative
+from utils.calcs import RankingContext, _bedroc_from_sum
+from model.calibration import calibrate
+from model.bootstrap import bootstrap_intervals
+from utils.putils import scale, num_derivative, savgol_derivative, spline_derivative
+from utils.loading import read_scores
+from utils.profiling import stage
 
 # Constants
-FORMATS = {"csv": pd.read_csv, "excel": pd.read_excel}
-MODEL = LogisticRegression(solver="lbfgs", penalty=None)
+MODEL_PARAMS = dict(solver="lbfgs", penalty=None)
+THRESHOLD_STRATEGIES = {"derivative": num_derivative, "savgol": savgol_derivative, "spline": spline_derivative}
 
 # Functions
 def read(file: str):
-    format_func = FORMATS["excel"] if file.endswith((".xlsx", ".ods")) else FORMATS["csv"]
-    return format_func(file, sep=None, engine='python')
+    return read_scores(file)
+
+def fit_predict(x, y, calibration="sklearn", n_bins=None):
+    """
+    Fits the score to activity probability mapping and returns the probabilities.
+
+    ``calibration`` is "sklearn" for the LogisticRegression model, or one of the
+    faster closed-form methods in ``model.calibration.CALIBRATIONS``. With
+    ``n_bins``, the "logistic" calibration is fitted on that many equal-width
+    score bins, which skips the sort of the scores and is approximate. Every
+    call fits its own model, so concurrent calls do not share any state.
+    """
+    if n_bins and calibration != "logistic":
+        raise ValueError("Score bins are only supported by the logistic calibration")
+    if n_bins:
+        return calibrate(x, y, calibration, n_bins=n_bins)
+    if calibration != "sklearn":
+        return calibrate(x, y, calibration)
 
-def fit_predict(x, y):
     x = x.reshape(-1, 1)
-    clf = MODEL.fit(x, y)
+    clf = LogisticRegression(**MODEL_PARAMS).fit(x, y)
     predictions = clf.predict_proba(x)[:, 1]
     return predictions
 
@@ -28,47 +47,69 @@ def preprocess_data(df):
     df = df.dropna(axis=1, how='all')
 
     cols = df.columns
+    if len(cols) < 2:
+        raise ValueError("The data has no activity column")
     scores = df[cols[0]].values
     actives = df[cols[1]].values
 
     return np.array(scores), np.array(actives)
 
 def generate_precision_recall(predictions, activity):
-    precision, recall, thresholds = precision_recall_curve(activity, predictions)
-    return precision, recall, thresholds
+    return RankingContext(activity, predictions).precision_recall_curve()
     
 
-def calculate_curves(program_name, scores, activity):
+def calculate_curves(program_name, scores, activity, calibration="sklearn", ef_cutoffs=None,
+                     n_resamples=0, n_bins=None):
     """
     Calculates ROC, precision-recall, and BEDROC along with percentile enrichment data.
     
     Args:
-        program_name: A string representing the name of the program (not used directly).
+        program_name: A string representing the name of the program (only used to tag the profiling stages).
         scores: A numpy array of prediction scores.
         activity: A numpy array of binary labels (1 for active compounds, 0 for decoys).
+        calibration: The score to probability mapping used by ``fit_predict``.
+        ef_cutoffs: Optional top fractions (e.g. 0.01 for EF1%) at which to report the enrichment factor.
+        n_resamples: The number of bootstrap replicates of the 95% confidence intervals of the AUC, the
+            BEDROC and the reported enrichment factors (e.g. ``model.bootstrap.DEFAULT_RESAMPLES``).
+            0, the default, skips the intervals, which take far longer than the metrics themselves.
+        n_bins: Optional number of score bins of the approximate "logistic" fit (see ``fit_predict``).
     
     Returns:
         A dictionary containing ROC, precision-recall, BEDROC, and percentile enrichment data.
     """
- # Fit and predict (assuming fit_predict ranks scores by likelihood)
-    predictions = fit_predict(scores, activity)  # Assuming this gives probabilities
-    
-    # Sort predictions in decreasing order and align the activity labels accordingly
-    sorted_indices = np.argsort(-predictions)  # Negative sign to sort in descending order
-    sorted_predictions = predictions[sorted_indices]
-    sorted_activity = activity[sorted_indices]
-    ranked_indices = np.arange(len(sorted_activity))  # Assuming rank positions
+    # Fit and predict (fit_predict ranks scores by likelihood)
+    with stage("fit", program=program_name, calibration=calibration):
+        predictions = fit_predict(scores, activity, calibration, n_bins)
+
+    # Rank the predictions once; every curve below reads from this ranking
+    with stage("sort", program=program_name):
+        ranking = RankingContext(activity, predictions)
+
+    return ranking_curves(program_name, ranking, ef_cutoffs, n_resamples)
+
+def ranking_curves(program_name, ranking, ef_cutoffs=None, n_resamples=0, enrichment_factors=None,
+                   bedroc=None):
+    """
+    The curves of ``calculate_curves`` from the ranking of the predictions.
+
+    ``enrichment_factors`` (at every percentile) and ``bedroc`` can be given
+    when they are already computed, e.g. by ``calculate_curves_batch``.
+    """
     # ROC curve calculation
-    fpr, tpr, thresholds = roc_curve(sorted_activity[::-1], sorted_predictions[::-1], pos_label=1)
-    roc_auc = auc(fpr, tpr)
+    with stage("roc", program=program_name):
+        fpr, tpr, thresholds = ranking.roc_curve()
+        roc_auc = auc(fpr, tpr)
 
     # Step 3: Generate percentile data for enrichment factors
-    pc_x = generate_percentiles(predictions[sorted_indices[::-1]])
-    n_actives = sum(activity)
-    enrichment_factors = [calculate_enrichment_factor(activity, predictions, 1-x) for x in pc_x]
+    pc_x = generate_percentiles(ranking.sorted_pred)
+    if enrichment_factors is None:
+        with stage("enrichment", program=program_name):
+            enrichment_factors = ranking.enrichment_factors(1 - pc_x)
 
     # Step 4: Calculate BEDROC score
-    bedroc = bedroc_score(activity, predictions)
+    if bedroc is None:
+        with stage("bedroc", program=program_name):
+            bedroc = ranking.bedroc()
 
     # Step 5: Prepare ROC data
     roc_data = {
@@ -79,18 +120,30 @@ def calculate_curves(program_name, scores, activity):
         "bedroc": bedroc
     }
 
+    # Bootstrap confidence intervals, from the same ranking
+    intervals = None
+    if n_resamples and 0 < ranking.n_actives < ranking.n:
+        with stage("bootstrap", program=program_name, n_resamples=n_resamples):
+            intervals = bootstrap_intervals(ranking, n_resamples, ef_cutoffs=ef_cutoffs or ())
+        roc_data["auc_ci"] = np.array(intervals["auc"])
+        roc_data["bedroc_ci"] = np.array(intervals["bedroc"])
+
     # Step 6: Prepare percentile enrichment data
-    pc_y = predictions[sorted_indices[::-1]]
-    prevalence = n_actives / len(activity)
+    pc_y = ranking.sorted_pred[::-1]
     pc_data = {
         "x": pc_x,
         "y": pc_y,
-        "avg_score": prevalence,
+        "avg_score": ranking.prevalence,
         "efs": enrichment_factors
     }
+    if ef_cutoffs is not None:
+        pc_data["ef_cutoffs"] = dict(zip(ef_cutoffs, ranking.enrichment_factors(ef_cutoffs)))
+        if intervals is not None:
+            pc_data["ef_cutoffs_ci"] = intervals["ef"]
 
     # Step 7: Calculate precision-recall curve
-    precision, recall, pr_thresholds = precision_recall_curve(activity, predictions)
+    with stage("precision_recall", program=program_name):
+        precision, recall, pr_thresholds = ranking.precision_recall_curve()
 
     # Step 8: Return all calculated curves and data
     return {
@@ -103,9 +156,103 @@ def calculate_curves(program_name, scores, activity):
         }
     }
 
-def calculate_selected_x(predictions):
-    x_prime, y_hat_prime = num_derivative(generate_percentiles(predictions), predictions)
+def calculate_curves_batch(program_names, score_matrix, activity, calibration="sklearn", ef_cutoffs=None,
+                           n_resamples=0, alpha=20.0, executor=None, n_bins=None):
+    """
+    ``calculate_curves`` of several programs that scored the same library.
+
+    The programs are the columns of ``score_matrix`` and share one activity
+    vector, so the activity bookkeeping is done once: the predictions of all
+    programs are sorted in one call, and the enrichment factors at every
+    percentile and the BEDROC of all programs come from array operations over
+    the stacked rankings. The ROC and precision-recall curves, whose lengths
+    depend on the ties of each program, and the bootstrap intervals are then
+    read from the ranking of each program. Every program still gets its own
+    calibration model, so the curves are the same as with ``calculate_curves``.
+
+    Args:
+        program_names: The names of the P programs.
+        score_matrix: The (N, P) scores, one column per program.
+        activity: The N binary labels (1 for active compounds, 0 for decoys) shared by every program.
+        calibration, ef_cutoffs, n_resamples, n_bins: As in ``calculate_curves``.
+        alpha: The early recognition parameter of the BEDROC.
+        executor: Optional executor (e.g. a ``ThreadPoolExecutor``) running the
+            fits and the per-program curves concurrently.
+
+    Returns:
+        The curves of each program, in the order of the columns.
+    """
+    curves = [None] * len(program_names)
+    for i, program_curves in iter_curves_batch(program_names, score_matrix, activity, calibration, ef_cutoffs,
+                                               n_resamples, alpha, executor, n_bins):
+        curves[i] = program_curves
+    return curves
+
+def iter_curves_batch(program_names, score_matrix, activity, calibration="sklearn", ef_cutoffs=None,
+                      n_resamples=0, alpha=20.0, executor=None, n_bins=None):
+    """
+    ``calculate_curves_batch`` yielding ``(column, curves)`` as soon as the
+    curves of each program are done, in completion order with an executor, so
+    the caller can report the progress.
+    """
+    score_matrix = np.asarray(score_matrix, dtype=np.float64)
+    activity = np.asarray(activity)
+    if score_matrix.shape != (len(activity), len(program_names)):
+        raise ValueError("The score matrix must have one row per compound and one column per program")
+
+    n_programs, n = len(program_names), len(activity)
+    n_actives = int(np.count_nonzero(activity))
+    map_programs = executor.map if executor is not None else map
+
+    # one contiguous row per program
+    with stage("fit", programs=n_programs, calibration=calibration):
+        predictions = np.vstack(list(map_programs(lambda scores: fit_predict(scores, activity, calibration, n_bins),
+                                                  np.ascontiguousarray(score_matrix.T))))
+
+    with stage("sort", programs=n_programs):
+        orders = np.argsort(predictions, axis=1, kind='mergesort')[:, ::-1]
+        sorted_true = activity[orders]
+
+    with stage("enrichment", programs=n_programs):
+        cutoffs = (n * (1 - generate_percentiles(activity))).astype(int)
+        cumulative_actives = np.zeros((n_programs, n + 1), dtype=np.int64)
+        np.cumsum(sorted_true, axis=1, out=cumulative_actives[:, 1:])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            enrichment_factors = (cumulative_actives[:, cutoffs] / n_actives) / (cutoffs / n)
+
+    with stage("bedroc", programs=n_programs):
+        # every program ranks the same number of actives
+        ranks = np.nonzero(sorted_true)[1].reshape(n_programs, n_actives)
+        bedrocs = _bedroc_from_sum(np.sum(np.exp(-alpha * ranks / n), axis=1), n_actives, n, alpha)
+
+    def program_curves(i):
+        ranking = RankingContext(activity, predictions[i], order=orders[i])
+        return ranking_curves(program_names[i], ranking, ef_cutoffs, n_resamples,
+                              enrichment_factors=enrichment_factors[i], bedroc=bedrocs[i])
+
+    if executor is None:
+        for i in range(n_programs):
+            yield i, program_curves(i)
+        return
+
+    futures = {executor.submit(program_curves, i): i for i in range(n_programs)}
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+def calculate_selected_x(predictions, strategy="derivative", threshold=0.34):
+    """
+    Selects the quantile where the predictiveness curve starts to rise, i.e. the
+    first point where its scaled derivative exceeds ``threshold``.
+
+    ``strategy`` picks the derivative from ``THRESHOLD_STRATEGIES``: the plain
+    finite differences ("derivative"), or the smoothed Savitzky-Golay ("savgol")
+    and spline ("spline") derivatives, which are steadier on noisy curves.
+    """
+    if strategy not in THRESHOLD_STRATEGIES:
+        raise ValueError(f"Invalid threshold strategy '{strategy}'")
+
+    x_prime, y_hat_prime = THRESHOLD_STRATEGIES[strategy](generate_percentiles(predictions), predictions)
     x_prime, y_hat_prime = scale(x_prime), scale(y_hat_prime)
 
-    threshold_idx = np.argmax(y_hat_prime > 0.34)
+    threshold_idx = np.argmax(y_hat_prime > threshold)
     return x_prime[threshold_idx]
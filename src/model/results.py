@@ -0,0 +1,86 @@
+import numpy as np
+
+# Constants
+DEFAULT_DTYPE = np.float32
+# the curve arrays of ``calculate_curves``, in the order they are stored in the buffer
+ARRAYS = (
+    ("pc", "x"), ("pc", "y"), ("pc", "efs"),
+    ("roc", "x"), ("roc", "y"), ("roc", "thresholds"),
+    ("precision_recall", "x"), ("precision_recall", "y"), ("precision_recall", "thresholds"),
+)
+POSITIONS = {name: i for i, name in enumerate(ARRAYS)}
+
+
+def interval(values) -> tuple:
+    if values is None:
+        return (np.nan, np.nan)
+    low, high = np.asarray(values, dtype=float)
+    return float(low), float(high)
+
+
+class Curves:
+    """
+    Compact, read-only container of the results of ``calculate_curves``.
+
+    Every curve array is a view into one contiguous buffer of ``dtype``
+    (float32 by default, which is plenty for plotting), while the AUC, the
+    BEDROC, their confidence intervals and the prevalence are kept as Python
+    floats. Intervals missing from the curves are (nan, nan).
+    """
+    __slots__ = ("__buffer", "__ends", "__auc", "__bedroc", "__prevalence", "__auc_ci", "__bedroc_ci")
+
+    def __init__(self, curves: dict, dtype=DEFAULT_DTYPE):
+        arrays = [np.ravel(np.asarray(curves[group][key], dtype=np.float64)) for group, key in ARRAYS]
+
+        self.__buffer = np.concatenate(arrays).astype(dtype, copy=False)
+        self.__buffer.flags.writeable = False
+        self.__ends = np.cumsum([len(array) for array in arrays])
+
+        self.__auc = float(curves["roc"]["auc"])
+        self.__bedroc = float(curves["roc"]["bedroc"])
+        self.__prevalence = float(curves["pc"]["avg_score"])
+        self.__auc_ci = interval(curves["roc"].get("auc_ci"))
+        self.__bedroc_ci = interval(curves["roc"].get("bedroc_ci"))
+
+    def array(self, group: str, key: str) -> np.ndarray:
+        i = POSITIONS[(group, key)]
+        start = self.__ends[i - 1] if i > 0 else 0
+        return self.__buffer[start:self.__ends[i]]
+
+    @property
+    def auc(self) -> float:
+        return self.__auc
+
+    @property
+    def bedroc(self) -> float:
+        return self.__bedroc
+
+    @property
+    def prevalence(self) -> float:
+        return self.__prevalence
+
+    @property
+    def auc_ci(self) -> tuple:
+        return self.__auc_ci
+
+    @property
+    def bedroc_ci(self) -> tuple:
+        return self.__bedroc_ci
+
+    @property
+    def nbytes(self) -> int:
+        return self.__buffer.nbytes
+
+    def to_dict(self) -> dict:
+        """The curves in the layout returned by ``calculate_curves``."""
+        curves = {group: {} for group, _ in ARRAYS}
+        for group, key in ARRAYS:
+            curves[group][key] = self.array(group, key)
+
+        curves["pc"]["avg_score"] = self.__prevalence
+        curves["roc"]["auc"] = self.__auc
+        curves["roc"]["bedroc"] = self.__bedroc
+        curves["roc"]["auc_ci"] = np.array(self.__auc_ci)
+        curves["roc"]["bedroc_ci"] = np.array(self.__bedroc_ci)
+
+        return curves
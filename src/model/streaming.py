@@ -0,0 +1,200 @@
+import numpy as np
+from scipy.special import expit
+from sklearn.metrics import auc
+from model.calibration import newton_logistic
+from utils.calcs import TieGroupRanking, _bedroc_from_sum, exp_rank_sum, pro_rata_top_actives
+from utils.loading import read_score_chunks
+
+# Constants
+DEFAULT_BINS = 2 ** 16
+DEFAULT_CHUNKSIZE = 1_000_000
+
+
+class ScoreHistogram:
+    """
+    Fixed-resolution histogram of the scores of actives and decoys, filled
+    chunk by chunk so the full score vector never has to be in memory.
+
+    Scores outside ``[lo, hi]`` are counted in the first or last bin.
+    """
+
+    def __init__(self, lo: float, hi: float, n_bins: int = DEFAULT_BINS):
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.n_bins = n_bins
+        self.width = (self.hi - self.lo) / n_bins if self.hi > self.lo else 1.0
+
+        self.actives = np.zeros(n_bins)
+        self.decoys = np.zeros(n_bins)
+        self.sums = np.zeros(n_bins)
+
+    def update(self, scores, activity):
+        scores = np.asarray(scores, dtype=float)
+        activity = np.asarray(activity) > 0
+
+        bins = np.clip(((scores - self.lo) / self.width).astype(np.intp), 0, self.n_bins - 1)
+        self.actives += np.bincount(bins, weights=activity, minlength=self.n_bins)
+        self.decoys += np.bincount(bins, weights=~activity, minlength=self.n_bins)
+        self.sums += np.bincount(bins, weights=scores, minlength=self.n_bins)
+
+    @classmethod
+    def from_files(cls, files, n_bins=DEFAULT_BINS, score_range=None, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Builds the histogram of one or more result files.
+
+        Without a ``score_range``, the files are read twice: once for the
+        score range and once to fill the bins.
+        """
+        if score_range is None:
+            lo, hi = np.inf, -np.inf
+            for file in files:
+                for scores, _ in read_score_chunks(file, chunksize):
+                    if len(scores):
+                        lo, hi = min(lo, scores.min()), max(hi, scores.max())
+            if lo > hi:
+                raise ValueError("No scores found in the result files")
+            score_range = (lo, hi)
+
+        histogram = cls(*score_range, n_bins=n_bins)
+        for file in files:
+            for scores, activity in read_score_chunks(file, chunksize):
+                histogram.update(scores, activity)
+
+        return histogram
+
+
+class HistogramRanking(TieGroupRanking):
+    """
+    Ranking of a ``ScoreHistogram``, where every bin is a tie group. Only the
+    counts of the groups are known, not the order of the compounds, so it is a
+    ``TieGroupRanking`` rather than a ``RankingContext``.
+
+    The bins are ranked by the logistic activity probability fitted on their
+    counts. The ROC and precision-recall curves treat each bin like a group of
+    tied predictions. The enrichment factors and the BEDROC assume the actives
+    of a bin are spread evenly over its ranks, and the ``*_bounds`` methods give
+    the values for the actives placed at the top or at the bottom of their bins.
+    """
+
+    def __init__(self, histogram: ScoreHistogram):
+        sizes = histogram.actives + histogram.decoys
+        filled = sizes > 0
+        values = histogram.sums[filled] / sizes[filled]
+        actives, decoys = histogram.actives[filled], histogram.decoys[filled]
+
+        intercept, slope = newton_logistic(values, sizes[filled], actives)
+        probabilities = expit(intercept + slope * values)
+
+        # rank the bins by decreasing probability and merge equal probabilities
+        order = np.argsort(probabilities, kind='mergesort')[::-1]
+        probabilities = probabilities[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(probabilities)) + 1]
+
+        self.group_actives = np.rint(np.add.reduceat(actives[order], starts)).astype(np.int64)
+        self.group_decoys = np.rint(np.add.reduceat(decoys[order], starts)).astype(np.int64)
+        self.group_sizes = self.group_actives + self.group_decoys
+        self.group_ends = np.cumsum(self.group_sizes)
+        self.group_starts = self.group_ends - self.group_sizes
+        super().__init__(probabilities[starts], np.cumsum(self.group_actives), np.cumsum(self.group_decoys))
+
+        self.bin_width = histogram.width
+        self.n_bins = histogram.n_bins
+
+    def _top_actives(self, top_percentages):
+        cutoffs = (self.n * np.asarray(top_percentages, dtype=float)).astype(int)
+        return (cutoffs, *pro_rata_top_actives(cutoffs, self.group_actives, self.group_sizes))
+
+    def _enrichment(self, top_actives, cutoffs):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (top_actives / self.n_actives) / (cutoffs / self.n)
+
+    def enrichment_factors(self, top_percentages):
+        cutoffs, estimate, _, _ = self._top_actives(top_percentages)
+        return self._enrichment(estimate, cutoffs)
+
+    def enrichment_factor_bounds(self, top_percentages):
+        cutoffs, _, lower, upper = self._top_actives(top_percentages)
+        return self._enrichment(lower, cutoffs), self._enrichment(upper, cutoffs)
+
+    def bedroc(self, alpha=20.0) -> float:
+        rank_sums = exp_rank_sum(self.group_starts, self.group_ends, self.n, alpha)
+        s = np.sum(self.group_actives / self.group_sizes * rank_sums)
+        return _bedroc_from_sum(s, self.n_actives, self.n, alpha)
+
+    def bedroc_bounds(self, alpha=20.0):
+        bottom = np.sum(exp_rank_sum(self.group_ends - self.group_actives, self.group_ends, self.n, alpha))
+        top = np.sum(exp_rank_sum(self.group_starts, self.group_starts + self.group_actives, self.n, alpha))
+        bounds = [_bedroc_from_sum(s, self.n_actives, self.n, alpha) for s in (bottom, top)]
+        return min(bounds), max(bounds)
+
+    def auc_error_bound(self) -> float:
+        """Largest difference between the binned AUC and the AUC of the exact scores."""
+        return 0.5 * np.sum(self.group_actives * self.group_decoys) / (self.n_actives * (self.n - self.n_actives))
+
+
+def calculate_streaming_curves(files, n_bins=DEFAULT_BINS, score_range=None, chunksize=DEFAULT_CHUNKSIZE,
+                               ef_cutoffs=None):
+    """
+    Calculates the same curves as ``calculate_curves`` from result files read in
+    chunks, for screens that do not fit in memory.
+
+    The scores are binned into a ``n_bins`` histogram and the activity
+    probability is a logistic fit on the bin counts. The curves are therefore
+    approximate; the returned "approximation" entry says by how much.
+
+    Args:
+        files: A list of result files (scores in the first column, activity in the second).
+        n_bins: The number of score bins.
+        score_range: Optional (min, max) of the scores. Saves one pass over the files.
+        chunksize: The number of rows read at a time.
+        ef_cutoffs: Optional top fractions at which to report the enrichment factor.
+
+    Returns:
+        A dictionary with the ROC, precision-recall and percentile enrichment data.
+    """
+    ranking = HistogramRanking(ScoreHistogram.from_files(files, n_bins, score_range, chunksize))
+
+    fpr, tpr, thresholds = ranking.roc_curve()
+    precision, recall, pr_thresholds = ranking.precision_recall_curve()
+
+    # one predictiveness point per bin, in ascending probability, with exact EFs at the bin edges
+    pc_x = ranking.group_sizes[::-1].cumsum() / ranking.n
+    top_actives = (ranking.tps - ranking.group_actives)[::-1]
+    efs = ranking._enrichment(top_actives, ranking.group_starts[::-1])
+
+    approximation = {
+        "n_compounds": ranking.n,
+        "n_actives": ranking.n_actives,
+        "n_bins": ranking.n_bins,
+        "bin_width": ranking.bin_width,
+        "largest_bin_fraction": ranking.group_sizes.max() / ranking.n,
+        "auc_error_bound": ranking.auc_error_bound(),
+        "bedroc_bounds": ranking.bedroc_bounds(),
+    }
+
+    pc_data = {
+        "x": pc_x,
+        "y": ranking.thresholds[::-1],
+        "avg_score": ranking.prevalence,
+        "efs": efs
+    }
+    if ef_cutoffs is not None:
+        pc_data["ef_cutoffs"] = dict(zip(ef_cutoffs, ranking.enrichment_factors(ef_cutoffs)))
+        approximation["ef_bounds"] = dict(zip(ef_cutoffs, zip(*ranking.enrichment_factor_bounds(ef_cutoffs))))
+
+    return {
+        "roc": {
+            "x": fpr,
+            "y": tpr,
+            "auc": auc(fpr, tpr),
+            "thresholds": thresholds,
+            "bedroc": ranking.bedroc()
+        },
+        "pc": pc_data,
+        "precision_recall": {
+            "x": recall,
+            "y": precision,
+            "thresholds": pr_thresholds
+        },
+        "approximation": approximation
+    }
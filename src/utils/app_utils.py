@@ -3,6 +3,8 @@ import plotly.graph_objects as go
 import matplotlib.pyplot as plt  # Import matplotlib
 from email import encoders
 from model.pydockstats import calculate_curves
+from components.charts import Predictiveness, ReceiverOperatingCharacteristic, PrecisionRecall
+from utils.rendering import figure_spec, plt_from_spec
 import numpy as np
 import plotly.graph_objects as go
 import streamlit as st
@@ -28,45 +30,19 @@ def initialize_session_states():
     if 'programs' not in st.session_state:
         st.session_state.programs = []
 
-    if 'paths' not in st.session_state:
-        st.session_state.paths = dict()
+    if 'charts' not in st.session_state:
+        st.session_state.charts = dict(pc=Predictiveness(), roc=ReceiverOperatingCharacteristic(),
+                                       precision_recall=PrecisionRecall())
+
+    # bootstrap resamples of the confidence intervals, set by the sidebar or a loaded checkpoint
+    if 'n_resamples' not in st.session_state:
+        st.session_state.n_resamples = 0
 
 
 
 def get_plt_from_plotly(plotly_fig: go.Figure) -> plt.Figure:
     # create a matplotlib figure like the plotly figure from a go.Figure object
-    plt.style.use(['science', 'no-latex'])
-
-    plt_fig, ax = plt.subplots(figsize=(10, 7))
-
-    def convert_line_dash(dash):
-        if dash == 'dash':
-            return '--'
-        elif dash == 'dot':
-            return ':'
-        else:
-            return '-'
-        
-    def format_trace_label(label: str):
-        return label.replace('<br>', '').replace('<b>', '').replace('</b>', '')
-        
-    plotly_fig.for_each_trace(lambda trace: ax.plot(trace.x, trace.y, label=format_trace_label(trace.name), linewidth=trace.line.width*0.8, 
-                                                    linestyle=convert_line_dash(trace.line.dash), color=trace.line.color))
-
-    ax.set_xlabel(plotly_fig.layout.xaxis.title.text, fontsize=14)
-    ax.set_ylabel(plotly_fig.layout.yaxis.title.text, fontsize=14)
-    ax.set_title(plotly_fig.layout.title.text, fontsize=17)
-
-    plt.grid(True, alpha=0.2, linewidth=0.4, color='black')
-
-    x_range = plotly_fig.layout.xaxis.range
-    y_range = plotly_fig.layout.yaxis.range
-    ax.set_xlim(x_range)
-    ax.set_ylim(y_range)
-    #ax.legend(bbox_to_anchor=(1.02, 1), loc='upper left', borderaxespad=0.)
-    ax.legend(loc='best', fontsize=11, frameon=True)
-
-    return plt_fig
+    return plt_from_spec(figure_spec(plotly_fig))
 
 # Function to upload ligands and decoys files
 def upload_files(program_name):
@@ -1,5 +1,138 @@
 import numpy as np
 
+
+class TieGroupRanking:
+    """
+    A ranking summarised by its tie groups, in decreasing order of prediction:
+    the threshold (prediction) of every group and the cumulative true/false
+    positive counts at its end. This is all the ROC and precision-recall
+    curves need, whether the groups come from ranking every compound
+    (``RankingContext``) or from a score histogram (``HistogramRanking``).
+
+    Args:
+        thresholds (np.ndarray): The prediction of each tie group.
+        tps (np.ndarray): The actives up to the end of each tie group.
+        fps (np.ndarray): The decoys up to the end of each tie group.
+    """
+
+    def __init__(self, thresholds, tps, fps):
+        self.thresholds = thresholds
+        self.tps = tps
+        self.fps = fps
+        self.n_actives = int(tps[-1])
+        self.n = self.n_actives + int(fps[-1])
+
+    @property
+    def prevalence(self) -> float:
+        return self.n_actives / self.n
+
+    def roc_curve(self, drop_intermediate=True):
+        """
+        Same output as ``sklearn.metrics.roc_curve`` for the ranked predictions.
+
+        Returns:
+            tuple: The false positive rates, true positive rates and thresholds.
+        """
+        tps, fps, thresholds = self.tps, self.fps, self.thresholds
+
+        if drop_intermediate and len(fps) > 2:
+            # drop thresholds that lie on a straight line of the curve
+            optimal_idxs = np.where(
+                np.r_[True, np.logical_or(np.diff(fps, 2), np.diff(tps, 2)), True]
+            )[0]
+            tps, fps, thresholds = tps[optimal_idxs], fps[optimal_idxs], thresholds[optimal_idxs]
+
+        # add an extra threshold so that the curve starts at (0, 0)
+        tps = np.r_[0, tps]
+        fps = np.r_[0, fps]
+        thresholds = np.r_[np.inf, thresholds]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fpr = fps / fps[-1]
+            tpr = tps / tps[-1]
+
+        return fpr, tpr, thresholds
+
+    def precision_recall_curve(self):
+        """
+        Same output as ``sklearn.metrics.precision_recall_curve`` for the ranked
+        predictions.
+
+        Returns:
+            tuple: The precision, recall and thresholds.
+        """
+        ps = self.tps + self.fps
+        precision = np.zeros(len(self.tps))
+        np.divide(self.tps, ps, out=precision, where=(ps != 0))
+
+        if self.tps[-1] == 0:
+            recall = np.ones(len(self.tps))
+        else:
+            recall = self.tps / self.tps[-1]
+
+        # reverse the outputs so recall is decreasing
+        return np.r_[precision[::-1], 1], np.r_[recall[::-1], 0], self.thresholds[::-1]
+
+
+class RankingContext(TieGroupRanking):
+    """
+    Ranks a prediction vector once and shares the ranking between the
+    ROC, precision-recall, BEDROC and enrichment factor computations.
+
+    The compounds are ordered by decreasing prediction (ties keep the
+    ``np.argsort(y_pred)[::-1]`` convention of ``calculate_enrichment_factor``).
+    Consecutive compounds with the same prediction form a tie group, and the
+    cumulative true/false positive counts are kept at the end of each group,
+    which is where the ROC and precision-recall thresholds are placed.
+
+    Args:
+        y_true (array_like): Binary class labels. 1 for the positive class,
+        0 otherwise.
+        y_pred (array_like): Prediction values.
+        order (array_like): Optional ranking of the predictions, when it is
+        already known (e.g. from a batched sort of several programs).
+    """
+
+    def __init__(self, y_true, y_pred, order=None):
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+        assert len(y_true) == len(y_pred), \
+            'O número de pontuações deve ser igual ao número de rótulos.'
+
+        n = len(y_true)
+        self.order = np.argsort(y_pred, kind='mergesort')[::-1] if order is None else np.asarray(order)
+        self.sorted_pred = y_pred[self.order]
+        self.sorted_true = y_true[self.order]
+
+        # cumulative_actives[k] is the number of actives in the top k compounds
+        self.cumulative_actives = np.concatenate(([0], np.cumsum(self.sorted_true)))
+
+        # index of the last compound of every tie group
+        distinct_value_indices = np.where(np.diff(self.sorted_pred))[0]
+        self.threshold_idxs = np.r_[distinct_value_indices, n - 1]
+        tps = self.cumulative_actives[self.threshold_idxs + 1]
+        super().__init__(self.sorted_pred[self.threshold_idxs], tps, 1 + self.threshold_idxs - tps)
+
+    def enrichment_factors(self, top_percentages):
+        """
+        Enrichment Factor at each top percentage of the ranked list.
+
+        The cutoff is truncated with ``int()`` semantics, as in
+        ``calculate_enrichment_factor``.
+        """
+        cutoffs = (self.n * np.asarray(top_percentages, dtype=float)).astype(int)
+        top_actives = self.cumulative_actives[cutoffs]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            efs = (top_actives / self.n_actives) / (cutoffs / self.n)
+
+        return efs
+
+    def bedroc(self, alpha=20.0) -> float:
+        """BEDROC score of the ranking (see ``bedroc_score``)."""
+        return _bedroc_from_ranks(self.sorted_true.nonzero()[0], self.n, alpha)
+
+
 def optimal_threshold(fpr, tpr, thresholds):
     # selecting the optimal threshold based on ROC
     selected_t = thresholds[np.argmin(np.abs(fpr + tpr - 1))]
@@ -44,23 +177,28 @@ def calculate_enrichment_factor(y_true, y_pred, top_percentage=0.05):
     Returns:
         float: O Fator de Enriquecimento (EF).
     """
-    assert len(y_true) == len(y_pred), \
-        'O número de pontuações deve ser igual ao número de rótulos.'
+    return RankingContext(y_true, y_pred).enrichment_factors([top_percentage])[0]
 
-    # Classifica os valores de previsão em ordem decrescente
-    sorted_indices = np.argsort(y_pred)[::-1]
-    sorted_y_true = y_true[sorted_indices]
-
-    # Calcula o ponto de corte para a porcentagem superior
-    cutoff = int(len(y_true) * top_percentage)
+def calculate_enrichment_factors(y_true, y_pred, top_percentages):
+    """
+    Calculates the Enrichment Factor (EF) for many top percentages with a
+    single sort of the predictions.
 
-    # Calcula o número de ativos na porcentagem superior
-    top_actives = np.sum(sorted_y_true[:cutoff])
+    Gives the same values as calling ``calculate_enrichment_factor`` once per
+    percentage (including the ``int()`` truncation of the cutoff), but the
+    number of actives above every cutoff is read from one cumulative sum.
 
-    # Calcula o EF
-    ef = (top_actives / np.sum(y_true)) / (cutoff / len(y_true))
+    Args:
+        y_true (array_like): Binary class labels. 1 for the positive class,
+        0 otherwise.
+        y_pred (array_like): Prediction values.
+        top_percentages (array_like): Top percentages of the ranked list for
+        which to calculate the EF.
 
-    return ef
+    Returns:
+        np.ndarray: The Enrichment Factor for each percentage.
+    """
+    return RankingContext(y_true, y_pred).enrichment_factors(top_percentages)
 
 def calculate_bedroc(ranks: np.ndarray, n_actives: int, R: float = 20.0) -> float:
   """
@@ -115,16 +253,69 @@ def bedroc_score(y_true, y_pred, decreasing=True, alpha=20.0):
             Valor no intervalo [1] indicando o grau em que a técnica 
             preditiva empregada detecta (previamente) a classe positiva.
     """
-    assert len(y_true) == len(y_pred), \
-        'O número de pontuações deve ser igual ao número de rótulos'
-    big_n = len(y_true)
-    n = sum(y_true == 1)
-    if decreasing:
-        order = np.argsort(-y_pred)
-    else:
-        order = np.argsort(y_pred)
-    m_rank = (y_true[order] == 1).nonzero()[0]
-    s = np.sum(np.exp(-alpha * m_rank / big_n))
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    ranking = RankingContext(y_true, y_pred if decreasing else -y_pred)
+
+    return ranking.bedroc(alpha)
+
+
+def _bedroc_from_ranks(m_rank, big_n, alpha=20.0):
+    """BEDROC from the 0-based ranks ``m_rank`` of the actives among ``big_n`` compounds."""
+    return _bedroc_from_sum(np.sum(np.exp(-alpha * m_rank / big_n)), len(m_rank), big_n, alpha)
+
+
+def exp_rank_sum(first, last, big_n, alpha=20.0):
+    """
+    Sum of ``exp(-alpha * rank / big_n)`` over the 0-based ranks in ``[first, last)``,
+    in closed form (a geometric series), element-wise.
+
+    With the share of actives of each tie group, it gives the BEDROC sum of a
+    ranking whose actives are spread evenly over the ranks of their tie group.
+    """
+    decay = alpha / big_n
+    return (np.exp(-decay * first) - np.exp(-decay * last)) / (1 - np.exp(-decay))
+
+
+def pro_rata_top_actives(cutoffs, group_actives, group_sizes):
+    """
+    Number of actives in the top ``cutoffs`` ranks, when the actives of the tie
+    group a cutoff falls in are spread evenly over its ranks.
+
+    Args:
+        cutoffs (array_like): Numbers of top ranks.
+        group_actives, group_sizes (np.ndarray): The actives and the compounds
+        of each tie group, in rank order along the last axis (e.g. one row per
+        bootstrap replicate). Empty groups are allowed.
+
+    Returns:
+        tuple: The estimates, and the numbers of actives if those of the cut
+        group are all below (lower) or all above (upper) the cutoff, each with
+        one entry per cutoff along the last axis.
+    """
+    cutoffs = np.asarray(cutoffs).reshape(-1)
+    group_ends = np.cumsum(group_sizes, axis=-1)
+    actives_before = np.cumsum(group_actives, axis=-1) - group_actives
+
+    estimates, lower, upper = (np.empty(np.shape(group_sizes)[:-1] + (len(cutoffs),)) for _ in range(3))
+    for j, cutoff in enumerate(cutoffs):
+        # the first group ending after the cutoff
+        group = np.minimum(np.sum(group_ends <= cutoff, axis=-1, keepdims=True), group_ends.shape[-1] - 1)
+
+        actives, sizes, before, end = (np.take_along_axis(values, group, axis=-1)[..., 0]
+                                       for values in (group_actives, group_sizes, actives_before, group_ends))
+        inside = cutoff - (end - sizes)
+        share = np.divide(actives, sizes, out=np.zeros(np.shape(actives)), where=sizes > 0)
+
+        estimates[..., j] = before + inside * share
+        lower[..., j] = before + np.maximum(0, inside - (sizes - actives))
+        upper[..., j] = before + np.minimum(actives, inside)
+
+    return estimates, lower, upper
+
+
+def _bedroc_from_sum(s, n, big_n, alpha=20.0):
+    """BEDROC from ``s``, the sum of ``exp(-alpha * rank / big_n)`` over the ``n`` actives."""
     r_a = n / big_n
 
     # Calcular RIE_min e RIE_max usando as fórmulas corretas
@@ -142,4 +333,4 @@ def bedroc_score(y_true, y_pred, decreasing=True, alpha=20.0):
     # Calcular BEDROC usando RIE, RIE_min e RIE_max
     bedroc = (rie - rie_min) / (rie_max - rie_min)
 
-    return bedroc
\ No newline at end of file
+    return bedroc
@@ -0,0 +1,129 @@
+import io
+import json
+import zipfile
+from collections.abc import Mapping
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from model.cache import flatten, unflatten
+
+# Constants
+CHECKPOINT_FORMAT = "pydockstats-checkpoint"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_EXTENSION = "pdsz"
+MANIFEST = "manifest.json"
+COLUMNS = ("ligands", "decoys")
+
+
+def write_checkpoint(data_dict: Dict[str, Dict[str, pd.DataFrame]], file=None, settings=None):
+    """
+    Writes the programs of ``ProgramsExpanders.to_dict()`` as a checkpoint: a zip
+    archive with a JSON manifest and one compressed float64 .npy array per
+    score column of each program, plus a string array of the compound ids
+    when every compound has one. The curves of generated programs are stored
+    too, one .npy per array, with the hash of the data they were computed from.
+
+    Args:
+        data_dict: The ligands and decoys DataFrames (and optionally the curves
+            and data hash) of each program, by name.
+        file: Optional path or binary file to write to.
+        settings: Optional JSON-serialisable settings the curves were generated
+            with (e.g. ``n_resamples``), which are part of their data hash.
+
+    Returns:
+        The checkpoint bytes when no file is given.
+    """
+    target = io.BytesIO() if file is None else file
+
+    manifest = dict(format=CHECKPOINT_FORMAT, version=CHECKPOINT_VERSION, settings=dict(settings or {}), programs=[])
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for index, (name, data) in enumerate(data_dict.items()):
+            # entries are numbered since program names are not safe file names
+            entry = dict(name=name, path=f"programs/{index:03d}")
+
+            for column in COLUMNS:
+                scores = pd.to_numeric(data[column]['score'], errors='coerce').to_numpy(dtype=np.float64)
+                with archive.open(f"{entry['path']}/{column}.npy", "w") as f:
+                    np.save(f, scores, allow_pickle=False)
+                entry[column] = len(scores)
+
+                ids = data[column].get('id')
+                if ids is not None and len(ids) > 0 and ids.notna().all():
+                    with archive.open(f"{entry['path']}/{column}_ids.npy", "w") as f:
+                        np.save(f, np.asarray(ids.astype(str), dtype=str), allow_pickle=False)
+                    entry[f"{column}_ids"] = True
+
+            if data.get('curves') is not None:
+                curves = flatten(data['curves'])
+                for key, values in curves.items():
+                    with archive.open(f"{entry['path']}/curves/{key}.npy", "w") as f:
+                        np.save(f, values, allow_pickle=False)
+                entry["curves"] = list(curves)
+                entry["data_hash"] = data['data_hash']
+
+            manifest["programs"].append(entry)
+
+        archive.writestr(MANIFEST, json.dumps(manifest, indent=2))
+
+    if file is None:
+        return target.getvalue()
+
+
+class Checkpoint(Mapping):
+    """
+    Read-only view of a checkpoint written by ``write_checkpoint``.
+
+    Only the manifest is read when opening the checkpoint. The scores of a
+    program are read when it is accessed, as a dict like ``Program.to_dict()``,
+    so a checkpoint can be passed straight to ``ProgramsExpanders.from_data_dict``.
+    Programs saved with their curves do not need to be generated again, as
+    long as they are generated with the saved ``settings``. Nothing is ever
+    unpickled.
+    """
+
+    def __init__(self, file):
+        try:
+            self.__archive = zipfile.ZipFile(file)
+            manifest = json.loads(self.__archive.read(MANIFEST))
+        except (zipfile.BadZipFile, KeyError, ValueError):
+            raise ValueError("Not a PyDockStats checkpoint")
+
+        if manifest.get("format") != CHECKPOINT_FORMAT:
+            raise ValueError("Not a PyDockStats checkpoint")
+        if manifest.get("version", 0) > CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {manifest['version']}, "
+                             f"this version of PyDockStats reads up to version {CHECKPOINT_VERSION}")
+
+        self.version = manifest["version"]
+        # checkpoints written before the settings were saved have none
+        self.settings = manifest.get("settings", {})
+        self.__entries = {entry["name"]: entry for entry in manifest["programs"]}
+
+    def __getitem__(self, name) -> dict:
+        entry = self.__entries[name]
+        data = {column: pd.DataFrame(data=self.__read(f"{entry['path']}/{column}.npy"), columns=['score'])
+                for column in COLUMNS}
+        for column in COLUMNS:
+            if entry.get(f"{column}_ids"):
+                data[column]['id'] = self.__read(f"{entry['path']}/{column}_ids.npy")
+
+        if "curves" in entry:
+            data['curves'] = unflatten({key: self.__read(f"{entry['path']}/curves/{key}.npy")
+                                        for key in entry["curves"]})
+            data['data_hash'] = entry["data_hash"]
+
+        return data
+
+    def __iter__(self):
+        return iter(self.__entries)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def sizes(self, name) -> Dict[str, int]:
+        """The number of ligands and decoys of a program, from the manifest."""
+        return {column: self.__entries[name][column] for column in COLUMNS}
+
+    def __read(self, path) -> np.ndarray:
+        return np.load(io.BytesIO(self.__archive.read(path)), allow_pickle=False)
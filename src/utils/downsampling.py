@@ -0,0 +1,73 @@
+import numpy as np
+
+DEFAULT_MAX_POINTS = 2000
+
+
+def collinear_indices(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Indices of the points that are not in the middle of a straight segment.
+
+    Dropping the other points does not change the drawn line, e.g. the long
+    horizontal and vertical runs of a ROC curve keep only their ends.
+    """
+    if len(x) < 3:
+        return np.arange(len(x))
+
+    dx, dy = np.diff(x), np.diff(y)
+    # a middle point is kept when the direction changes across it
+    turns = dx[:-1] * dy[1:] - dy[:-1] * dx[1:] != 0
+    # or when the line reverses along the same direction
+    turns |= (dx[:-1] * dx[1:] + dy[:-1] * dy[1:]) < 0
+
+    return np.flatnonzero(np.r_[True, turns, True])
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of ``n_out`` points chosen by Largest-Triangle-Three-Buckets, which
+    keeps the visual shape of the line (peaks, steps and slopes).
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # the first and last points are always kept; the rest is split in buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    indices = np.empty(n_out, dtype=np.intp)
+    indices[0], indices[-1] = 0, n - 1
+
+    selected = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+
+        # the average of the next bucket (or the last point) is the third vertex of the triangle
+        if bucket < n_out - 3:
+            next_start, next_end = end, max(edges[bucket + 2], end + 1)
+        else:
+            next_start, next_end = n - 1, n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        areas = np.abs((x[selected] - avg_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (avg_y - y[selected]))
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+
+    return indices
+
+
+def downsample_indices(x, y, max_points=DEFAULT_MAX_POINTS) -> np.ndarray:
+    """
+    Indices of at most ``max_points`` points that preserve the shape of the
+    curve: collinear points are dropped first, then LTTB is applied if needed.
+    ``max_points=None`` keeps every point.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if max_points is None or len(x) <= max_points:
+        return np.arange(len(x))
+
+    # NaN rates (e.g. a ROC curve without decoys) would break the geometry
+    kept = collinear_indices(np.nan_to_num(x), np.nan_to_num(y))
+    if len(kept) > max_points:
+        kept = kept[lttb_indices(np.nan_to_num(x[kept]), np.nan_to_num(y[kept]), max_points)]
+
+    return kept
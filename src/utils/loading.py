@@ -0,0 +1,158 @@
+import csv
+import re
+import numpy as np
+import pandas as pd
+
+SNIFF_BYTES = 8192
+EXCEL_EXTENSIONS = (".xlsx", ".ods")
+DEFAULT_NAMES = ["score", "activity"]
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+def _is_number(token: str) -> bool:
+    try:
+        float(token.replace(",", "."))
+        return True
+    except ValueError:
+        return False
+
+
+def sniff_format(file: str, sample_size: int = SNIFF_BYTES) -> dict:
+    """
+    Sniffs the layout of a delimited result file from its first few KB.
+
+    Returns:
+        A dict with the ``delimiter`` (None for whitespace separated files such
+        as .lst lists), the ``decimal`` mark, the number of ``columns``, whether
+        the first line is a ``header`` and the column ``names`` found in it.
+    """
+    with open(file, "r", newline="") as f:
+        sample = f.read(sample_size)
+
+    # drop the last line, which may be cut in the middle
+    lines = [line for line in sample.splitlines()[:-1] or sample.splitlines() if line.strip()]
+    sample = "\n".join(lines)
+
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = None
+
+    first = lines[0] if lines else ""
+    tokens = [token.strip() for token in (first.split(delimiter) if delimiter else first.split())]
+    header = any(token and not _is_number(token) for token in tokens)
+
+    # "-7,5;1" style files use a comma as the decimal mark
+    decimal = "," if delimiter not in (None, ",") and re.search(r"\d,\d", sample) else "."
+
+    return dict(delimiter=delimiter, decimal=decimal, columns=len(tokens), header=header,
+                names=tokens if header else None)
+
+
+def read_scores(file: str, score_dtype=np.float32, activity_dtype=np.int8, engine: str = None) -> pd.DataFrame:
+    """
+    Reads the score and activity columns (the first two) of a result file.
+
+    The delimiter is sniffed once and the file is parsed with the pyarrow
+    engine when it is installed, or the C engine otherwise, with explicit
+    dtypes. Files with a single column (e.g. .lst score lists) are read as
+    scores only.
+    """
+    if file.endswith(EXCEL_EXTENSIONS):
+        df = pd.read_excel(file).dropna(axis=1, how="all").iloc[:, :2]
+        if df.iloc[:, 1:].isna().any(axis=None):
+            activity_dtype = np.float32
+        return df.astype(dict(zip(df.columns, [score_dtype, activity_dtype])))
+
+    names, kwargs = _csv_options(file, engine)
+    dtypes = dict(zip(names, [score_dtype, activity_dtype]))
+
+    try:
+        return pd.read_csv(file, dtype=dtypes, **kwargs)
+    except ValueError:
+        # e.g. empty activity cells, which int8 cannot hold
+        return pd.read_csv(file, dtype=dict(zip(names, [score_dtype, np.float32])), **kwargs)
+
+
+def read_score_chunks(file: str, chunksize: int = 1_000_000, score_dtype=np.float32):
+    """
+    Reads the score and activity columns of a result file in chunks of
+    ``chunksize`` rows, so files larger than memory can be processed.
+
+    Yields:
+        The scores and activities of every chunk as numpy arrays, without the
+        rows where either is missing.
+    """
+    if file.endswith(EXCEL_EXTENSIONS):
+        chunks = [read_scores(file, score_dtype, np.float32)]
+    else:
+        # pyarrow cannot read in chunks
+        names, kwargs = _csv_options(file, engine="c")
+        if len(names) < 2:
+            raise ValueError(f"'{file}' has no activity column")
+        chunks = pd.read_csv(file, dtype=dict(zip(names, [score_dtype, np.float32])),
+                             chunksize=chunksize, **kwargs)
+
+    for chunk in chunks:
+        values = chunk.iloc[:, :2].to_numpy()
+        values = values[~np.isnan(values).any(axis=1)]
+        yield values[:, 0], values[:, 1]
+
+
+def parse_scores(scores: pd.Series):
+    """
+    Converts pasted scores to floats, accepting a comma as the decimal separator.
+
+    Returns:
+        The float scores and the index of the cells that are not numbers.
+    """
+    if pd.api.types.is_numeric_dtype(scores):
+        values = scores.astype(float)
+    else:
+        text = scores.astype(str).str.replace(',', '.', regex=False)
+        try:
+            # numpy's conversion is the fastest when every cell is a number
+            values = pd.Series(text.to_numpy().astype(np.float64), index=scores.index)
+        except ValueError:
+            values = pd.to_numeric(text.str.strip(), errors='coerce')
+
+    return values, scores.index[values.isna() & scores.notna()]
+
+
+def parse_ids(ids: pd.Series):
+    """
+    Cleans pasted compound ids, which are optional: a column without any id
+    gives None.
+
+    Returns:
+        The ids as strings (or None) and the index of the rows missing an id
+        when only some rows have one.
+    """
+    text = ids.astype(str).str.strip()
+    missing = ids.isna() | (text == '')
+
+    if missing.all():
+        return None, ids.index[:0]
+    return text, ids.index[missing]
+
+
+def _csv_options(file: str, engine: str = None):
+    layout = sniff_format(file)
+    n_columns = max(1, min(layout["columns"], 2))
+    names = (layout["names"] if layout["header"] else DEFAULT_NAMES)[:n_columns]
+
+    if engine is None:
+        # pyarrow only handles single-character delimiters and dot decimals
+        single_char = layout["delimiter"] is not None and layout["decimal"] == "."
+        engine = "pyarrow" if PYARROW_AVAILABLE and single_char else "c"
+
+    kwargs = dict(sep=layout["delimiter"] or r"\s+", decimal=layout["decimal"],
+                  header=None, skiprows=1 if layout["header"] else 0,
+                  names=names, usecols=list(range(len(names))), engine=engine)
+
+    return names, kwargs
@@ -0,0 +1,122 @@
+"""
+The two tiers of the result caches shared by every session (``CurvesCache``
+and ``FigureCache``): a bounded in-memory LRU and an optional directory of
+files, one per key, evicted by their modification time.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+class MemoryLRU:
+    """
+    Thread-safe LRU of at most ``max_entries`` values, and if ``max_bytes`` is
+    set, of at most ``max_bytes`` bytes as measured by ``sizeof``. A value
+    larger than ``max_bytes`` on its own is not kept.
+    """
+    def __init__(self, max_entries, max_bytes=None, sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.__entries = OrderedDict()
+        self.__nbytes = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the values kept, as measured by ``sizeof``."""
+        return self.__nbytes
+
+    def get(self, key):
+        """The value of ``key``, now the most recently used, or None."""
+        with self.__lock:
+            if key not in self.__entries:
+                return None
+            self.__entries.move_to_end(key)
+            return self.__entries[key][0]
+
+    def put(self, key, value):
+        nbytes = self.sizeof(value) if self.max_bytes is not None else 0
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__nbytes -= self.__entries.pop(key)[1]
+            if self.max_bytes is None or nbytes <= self.max_bytes:
+                self.__entries[key] = (value, nbytes)
+                self.__nbytes += nbytes
+            while self.__entries and (len(self.__entries) > self.max_entries or
+                                      self.max_bytes is not None and self.__nbytes > self.max_bytes):
+                self.__nbytes -= self.__entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__nbytes = 0
+
+
+class DiskLRU:
+    """
+    One file per key, named ``<key><extension>``, in ``directory``. The least
+    recently used files beyond ``max_entries`` are evicted, by their
+    modification time, which ``read`` refreshes.
+
+    Several processes may share the directory: files are written to a
+    temporary name unique to the process and thread, then renamed, so a reader
+    never sees a partial file.
+    """
+    def __init__(self, directory, extension, max_entries):
+        self.directory = directory
+        self.extension = extension
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, f"{key}{self.extension}")
+
+    def read(self, key, load):
+        """
+        Returns ``load(path)`` of the file of ``key``, or None if there is no
+        such file or it could not be loaded.
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            value = load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def write(self, key, dump):
+        """Writes the file of ``key`` with ``dump(f)`` on a binary file object."""
+        tmp_path = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            dump(f)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def evict(self):
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith(self.extension)]
+        if len(files) <= self.max_entries:
+            return
+
+        files.sort(key=self.__mtime)
+        for path in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def __mtime(path):
+        # another process may have evicted the file since it was listed
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
@@ -0,0 +1,147 @@
+"""
+Opt-in timing and memory instrumentation of the slow stages of the app.
+
+Profiling is off unless the ``PYDOCKSTATS_PROFILE`` environment variable is set
+(or ``enable`` is called, e.g. by the ``--profile`` flag of the CLI):
+
+    PYDOCKSTATS_PROFILE=1 streamlit run src/Home.py         # wall time and max RSS
+    PYDOCKSTATS_PROFILE=memory streamlit run src/Home.py    # also the tracemalloc peak
+
+Every stage is logged as one JSON line on the ``pydockstats.profile`` logger
+and kept in memory for the "Performance" panel of the sidebar. When profiling
+is off, ``stage`` costs a single check.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Constants
+PROFILE_ENV = "PYDOCKSTATS_PROFILE"
+MAX_RECORDS = 1000
+
+logger = logging.getLogger("pydockstats.profile")
+
+_records = deque(maxlen=MAX_RECORDS)
+_records_lock = threading.Lock()
+# tracemalloc stages open in the current thread, as [start, peak] in bytes
+_local = threading.local()
+_enabled = False
+_memory = False
+
+
+def enable(memory=False):
+    """Turns profiling on, with the tracemalloc peak of each stage if ``memory``."""
+    global _enabled, _memory
+    _enabled, _memory = True, memory
+
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+
+def disable():
+    global _enabled, _memory
+    _enabled, _memory = False, False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def max_rss_mb():
+    """The peak resident memory of the process so far, in MB (None if unknown)."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss / 2 ** 20 if sys.platform == "darwin" else max_rss / 2 ** 10
+
+
+def record(name: str, seconds: float, peak_mb=None, **tags):
+    """Logs and keeps the measure of one stage; also for stages timed elsewhere (e.g. in a process pool)."""
+    if not _enabled:
+        return
+
+    entry = dict(stage=name, seconds=seconds, peak_mb=peak_mb, max_rss_mb=max_rss_mb(),
+                 thread=threading.current_thread().name, time=time.time(), **tags)
+    with _records_lock:
+        _records.append(entry)
+    logger.info(json.dumps(entry, default=str))
+
+
+def records() -> list:
+    """The measures kept so far, oldest first."""
+    with _records_lock:
+        return list(_records)
+
+
+def clear():
+    with _records_lock:
+        _records.clear()
+
+
+@contextmanager
+def stage(name: str, **tags):
+    """
+    Times the enclosed block as the stage ``name``, with optional ``tags``
+    (e.g. the program name) added to its record.
+
+    With memory profiling, the record also has the peak of the memory traced
+    by tracemalloc during the block, above the memory at its start. Nested
+    stages are measured correctly, but tracemalloc is shared by every thread,
+    so the peaks of stages running concurrently are only approximate.
+    """
+    if not _enabled:
+        yield
+        return
+
+    memory = _memory
+    if memory:
+        stack = _memory_stack()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            # resetting the peak below would lose the peak of the enclosing stage
+            stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        stack.append([current, current])
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+
+        peak_mb = None
+        if memory:
+            begin, peak = stack.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            peak_mb = (peak - begin) / 2 ** 20
+
+        record(name, seconds, peak_mb, **tags)
+
+
+def _memory_stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+if os.environ.get(PROFILE_ENV, "").strip().lower() not in ("", "0", "false", "no", "off"):
+    enable(memory=os.environ[PROFILE_ENV].strip().lower() == "memory")
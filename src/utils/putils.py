@@ -1,6 +1,8 @@
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
+from scipy.interpolate import UnivariateSpline
+from scipy.signal import savgol_filter
+from utils.loading import read_scores
 
 def scale(x: np.array) -> np.array:
     _max = x.max()
@@ -11,27 +13,51 @@ def scale(x: np.array) -> np.array:
 
 def num_derivative(x: np.array, y: np.array) -> np.array:
     yprime = np.diff(y) / np.diff(x)
-    xprime = []
-
-    for i in range(len(yprime)):
-        xtemp = (x[i + 1] + x[i]) / 2
-        xprime = np.append(xprime, xtemp)
+    xprime = (x[1:] + x[:-1]) / 2
 
     return xprime, yprime
 
 
+def savgol_derivative(x: np.array, y: np.array, window_fraction: float = 0.02, polyorder: int = 3) -> np.array:
+    """
+    Savitzky-Golay smoothed derivative of ``y``, for evenly spaced ``x`` such as
+    the percentiles of the predictiveness curve.
+
+    The window covers ``window_fraction`` of the points (at least polyorder + 2).
+    """
+    window = max(int(len(y) * window_fraction) | 1, polyorder + 2 | 1)
+    if window > len(y):
+        return num_derivative(x, y)
+
+    yprime = savgol_filter(y, window, polyorder, deriv=1, delta=x[1] - x[0])
+    return x, yprime
+
+
+def spline_derivative(x: np.array, y: np.array, smoothing: float = None) -> np.array:
+    """
+    Derivative of a smoothing cubic spline fitted to ``y``.
+
+    By default the smoothing factor is set from the noise level estimated
+    with the second differences of ``y``.
+    """
+    if len(y) < 4:
+        return num_derivative(x, y)
+
+    if smoothing is None:
+        smoothing = len(y) * np.var(np.diff(y, 2)) / 6
+
+    spline = UnivariateSpline(x, y, k=3, s=smoothing)
+    return x, spline.derivative()(x)
+
+
 # aux functions
 def find_nearest(array, value):
     array = np.asarray(array)
     idx = (np.abs(array - value)).argmin()
     return array[idx]
 
-formats = {"csv": pd.read_csv, "excel": pd.read_excel}
 def read_result_file(file: str):
-    if file.endswith((".xlsx", ".ods")):
-        return formats["excel"](file)
-    else:
-        return formats["csv"](file, sep=None, engine='python')
+    return read_scores(file)
     
 def save_plots(pc_data, roc_data, names, save_path="."):
     # create the pc fig and the roc fig each with the programs plotted
@@ -77,40 +103,41 @@ def save_plots(pc_data, roc_data, names, save_path="."):
     return [fig_path, roc_path]
 
 # Function to generate realistic artificial docking scores for ligands and decoys
-def generate_artificial_scores(max_points: int = 1000):
+def generate_artificial_scores(max_points: int = 1000, seed=None, active_fraction: float = None):
     """
     Generate artificial docking scores that simulate the behavior of real-world docking data.
 
     Args:
-        num_ligands: Number of ligands (actives) to generate.
-        num_decoys: Number of decoys (inactive compounds) to generate.
+        max_points: Total number of compounds (ligands and decoys) to generate.
+        seed: Optional seed, so the same arguments always give the same scores.
+        active_fraction: Optional fraction of ligands. By default it is random, between 0.2 and 0.5.
 
     Returns:
         A dictionary containing the generated scores for ligands and decoys.
     """
+    rng = np.random.default_rng(seed)
+
     # random number of decoys (make it bigger than 0.5)
-    frac_decoys = 0.5 + np.random.rand() * 0.3
+    frac_decoys = 0.5 + rng.random() * 0.3 if active_fraction is None else 1 - active_fraction
 
     num_decoys = int(max_points * frac_decoys)  # Random number of decoys
     num_ligands = max_points - num_decoys  # Remaining points are ligands
 
     # Generate random docking scores for decoys and ligands
     # Decoys generally have worse (higher) scores than ligands, so we adjust the beta distribution
-    decoys = -1 * (np.random.beta(2, 5, num_decoys) * 10 + np.random.normal(0, 0.5, num_decoys))  # Shift to negative range
-    ligands = -1 * (np.random.beta(5, 2, num_ligands) * 8 + np.random.normal(0, 0.3, num_ligands))  # Better (lower) scores
+    decoys = -1 * (rng.beta(2, 5, num_decoys) * 10 + rng.normal(0, 0.5, num_decoys))  # Shift to negative range
+    ligands = -1 * (rng.beta(5, 2, num_ligands) * 8 + rng.normal(0, 0.3, num_ligands))  # Better (lower) scores
 
     # add powerful noise
-    decoys = decoys + np.random.normal(0, 2, num_decoys)
-    ligands = ligands + np.random.normal(0, 2, num_ligands)
+    decoys = decoys + rng.normal(0, 2, num_decoys)
+    ligands = ligands + rng.normal(0, 2, num_ligands)
 
-    # Introduce a few outliers (extremely good or bad scores)
-    frac_outliers = 0.01 + np.random.rand() * 0.05  # Fraction of outliers
-    n_outliers = int(max_points * frac_outliers)  # Number of outliers
-    ligand_outliers = -1 * np.random.uniform(0, 5, n_outliers)  # Very low (good) scores for a few ligands
-    ligands[:n_outliers] = ligand_outliers
-
-    decoy_outliers = -1 * np.random.uniform(10, 20, n_outliers)  # Very high (bad) scores for a few decoys
-    decoys[:n_outliers] = decoy_outliers
+    # Introduce a few outliers (extremely good or bad scores), in proportion to each class
+    frac_outliers = 0.01 + rng.random() * 0.05  # Fraction of outliers
+    n_ligand_outliers = int(num_ligands * frac_outliers)
+    n_decoy_outliers = int(num_decoys * frac_outliers)
+    ligands[:n_ligand_outliers] = -1 * rng.uniform(0, 5, n_ligand_outliers)  # Very low (good) scores for a few ligands
+    decoys[:n_decoy_outliers] = -1 * rng.uniform(10, 20, n_decoy_outliers)  # Very high (bad) scores for a few decoys
 
     # Create a DataFrame for easier manipulation and realistic output format
     data = {
@@ -118,5 +145,4 @@ def generate_artificial_scores(max_points: int = 1000):
         "ligands": ligands
     }
 
-
     return data
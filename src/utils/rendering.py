@@ -0,0 +1,80 @@
+import io
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import scienceplots  # noqa: F401 (registers the 'science' styles)
+import plotly.graph_objects as go
+
+
+def figure_spec(plotly_fig: go.Figure) -> dict:
+    """
+    Plain, picklable description of a plotly figure (titles, ranges and the
+    data and style of every trace), so it can be rendered in another process.
+    """
+    layout = plotly_fig.layout
+    return dict(
+        title=layout.title.text,
+        xaxis_title=layout.xaxis.title.text,
+        yaxis_title=layout.yaxis.title.text,
+        x_range=layout.xaxis.range,
+        y_range=layout.yaxis.range,
+        traces=[dict(x=np.asarray(trace.x), y=np.asarray(trace.y), name=trace.name, width=trace.line.width,
+                     dash=trace.line.dash, color=trace.line.color)
+                for trace in plotly_fig.data],
+    )
+
+
+def convert_line_dash(dash):
+    if dash == 'dash':
+        return '--'
+    elif dash == 'dot':
+        return ':'
+    else:
+        return '-'
+
+
+def format_trace_label(label: str):
+    return label.replace('<br>', '').replace('<b>', '').replace('</b>', '')
+
+
+def plt_from_spec(spec: dict) -> plt.Figure:
+    # create a matplotlib figure like the plotly figure described by the spec
+    plt.style.use(['science', 'no-latex'])
+
+    plt_fig, ax = plt.subplots(figsize=(10, 7))
+
+    for trace in spec['traces']:
+        ax.plot(trace['x'], trace['y'], label=format_trace_label(trace['name']), linewidth=trace['width']*0.8,
+                linestyle=convert_line_dash(trace['dash']), color=trace['color'])
+
+    ax.set_xlabel(spec['xaxis_title'], fontsize=14)
+    ax.set_ylabel(spec['yaxis_title'], fontsize=14)
+    ax.set_title(spec['title'], fontsize=17)
+
+    ax.grid(True, alpha=0.2, linewidth=0.4, color='black')
+
+    ax.set_xlim(spec['x_range'])
+    ax.set_ylim(spec['y_range'])
+    #ax.legend(bbox_to_anchor=(1.02, 1), loc='upper left', borderaxespad=0.)
+    ax.legend(loc='best', fontsize=11, frameon=True)
+
+    return plt_fig
+
+
+def render_png(spec: dict, dpi: int = 200) -> bytes:
+    """
+    Renders a figure spec to PNG bytes. Runs in the worker processes of the
+    figure downloader, since pyplot is not thread-safe.
+    """
+    matplotlib.use('Agg')
+    plt_fig = plt_from_spec(spec)
+
+    buffer = io.BytesIO()
+    plt_fig.savefig(buffer, format='png', dpi=dpi)
+    plt.close(plt_fig)
+
+    return buffer.getvalue()
+
+
+def plotly_png(plotly_fig: go.Figure) -> bytes:
+    return plotly_fig.to_image(format='png')
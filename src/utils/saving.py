@@ -2,23 +2,98 @@ import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
-from smtplib import SMTPRecipientsRefused, SMTPConnectError
+from smtplib import (SMTPRecipientsRefused, SMTPConnectError, SMTPAuthenticationError, SMTPServerDisconnected,
+                     SMTPException)
 import streamlit as st
-import matplotlib.pyplot as plt
-import scienceplots
-from utils.app_utils import get_plt_from_plotly
+from utils.rendering import figure_spec, render_png, plotly_png
+from utils import profiling
+from utils.profiling import stage
+from utils.lru import DiskLRU, MemoryLRU
 from components.charts import Chart
 import os
+import hashlib
+import threading
+import multiprocessing
+import queue
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
 import plotly.graph_objects as go
 
+FIGURE_CACHE_ENTRIES = 256
+FIGURE_MEMORY_ENTRIES = 64
+RENDER_WORKERS = 3
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 587
+SMTP_TIMEOUT = 30
+SMTP_IDLE_TIMEOUT = 60
+EMAIL_BATCH_WINDOW = 0.5
+# seconds between the reruns of the app that show the status of a queued email
+EMAIL_POLL_INTERVAL = 0.5
+
+# Shared by every session: the render workers and the renders still in flight, by digest
+_render_pool = None
+_pending = {}
+_pending_lock = threading.Lock()
+_email_queue = None
+
+
+def render_pool() -> ProcessPoolExecutor:
+    """
+    Process pool of the figure renders, created on first use. pyplot is not
+    thread-safe, so each render runs in its own process; spawned rather than
+    forked so the workers do not inherit the server threads.
+    """
+    global _render_pool
+    with _pending_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                               mp_context=multiprocessing.get_context("spawn"))
+    return _render_pool
+
+
+def email_queue() -> "EmailQueue":
+    """The email queue shared by every session, created on first use."""
+    global _email_queue
+    with _pending_lock:
+        if _email_queue is None:
+            _email_queue = EmailQueue(EmailSender.from_secrets())
+    return _email_queue
+
+
 class EmailSender:
-    def __init__(self, smtp_server, smtp_port):
+    """
+    Sends the chart images by email through one SMTP connection, which is
+    opened on the first email and reused by the next ones until ``close()``.
+
+    The credentials default to the ``[email]`` section of the Streamlit secrets.
+    Without a password the sender does not log in, e.g. for a local test server.
+    """
+    def __init__(self, smtp_server, smtp_port, starttls=True, sender_email=None, password=None, username=None):
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
-        self.__sender_email = st.secrets['email']['address']
-        self.__password = st.secrets['email']['password']
+        self.starttls = starttls
+        self.__sender_email = sender_email or st.secrets['email']['address']
+        self.__password = password if sender_email else st.secrets['email'].get('password')
+        self.__username = username or self.__sender_email
+        self.__server = None
+
+    @classmethod
+    def from_secrets(cls):
+        """
+        Reads the server from the ``[email]`` secrets: ``host`` (smtp.gmail.com),
+        ``port`` (587), ``starttls`` (true), ``address``, ``username`` and ``password``.
+        """
+        settings = st.secrets['email']
+        return cls(settings.get('host', SMTP_HOST), int(settings.get('port', SMTP_PORT)),
+                   starttls=settings.get('starttls', True), sender_email=settings['address'],
+                   password=settings.get('password'), username=settings.get('username'))
 
-    def send_email_with_images(self, receiver_email, subject, image_paths: list):
+    def build_message(self, receiver_email, subject, images: list) -> MIMEMultipart:
+        """
+        Args:
+            images: (file name, PNG bytes) pairs attached to the email.
+        """
         message = MIMEMultipart()
         message['From'] = self.__sender_email
         message['To'] = receiver_email
@@ -28,85 +103,341 @@ class EmailSender:
             MIMEText("Here are the performance metric figures generated by PyDockStats.", 'plain')
         )
 
-        for image_path in image_paths:
-            with open(image_path, 'rb') as f:
-                image = MIMEImage(f.read())
-                image.add_header('Content-ID', f'<{image_path}>')
-                image.add_header('Content-Disposition', 'attachment', filename=os.path.basename(image_path))
-                message.attach(image)
+        for file_name, data in images:
+            image = MIMEImage(data, 'png')
+            image.add_header('Content-ID', f'<{file_name}>')
+            image.add_header('Content-Disposition', 'attachment', filename=file_name)
+            message.attach(image)
 
-        text = message.as_string()
+        return message
 
+    def connect(self) -> smtplib.SMTP:
+        # reuse the open connection while the server still answers
+        if self.__server is not None:
+            try:
+                if self.__server.noop()[0] == 250:
+                    return self.__server
+            except SMTPException:
+                pass
+            self.close()
+
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=SMTP_TIMEOUT)
         try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+            if self.starttls:
                 server.starttls()
-                server.login(self.__sender_email, self.__password)
-                server.sendmail(self.__sender_email, receiver_email, text)
-                return dict(status="success", message="Email sent successfully")
+            if self.__password:
+                server.login(self.__username, self.__password)
+        except Exception:
+            server.close()
+            raise
+
+        self.__server = server
+        return server
+
+    def close(self):
+        if self.__server is None:
+            return
+
+        try:
+            self.__server.quit()
+        except (SMTPException, OSError):
+            self.__server.close()
+        self.__server = None
+
+    def send_email_with_images(self, receiver_email, subject, images: list, on_progress=None):
+        """
+        Sends the email and returns a dict with its "status" and a "message".
+
+        Args:
+            on_progress: Optional callable receiving the fraction done and a description of the step.
+                The last call has the message of the result, also when the email was not sent.
+        """
+        on_progress = on_progress or (lambda fraction, step: None)
+
+        on_progress(0.1, "Building the email")
+        text = self.build_message(receiver_email, subject, images).as_string()
+
+        try:
+            on_progress(0.4, "Connecting to the server")
+            server = self.connect()
+            on_progress(0.7, "Sending")
+            server.sendmail(self.__sender_email, receiver_email, text)
+            result = dict(status="success", message="Email sent successfully")
 
         except SMTPRecipientsRefused:
-            return dict(status="SMTPRecipientsRefused", message=f"The email address \"{receiver_email}\" is not valid")
-        
-        except SMTPConnectError:
-            return dict(status="SMTPConnectError", message="Could not connect to the server")
+            result = dict(status="SMTPRecipientsRefused",
+                          message=f"The email address \"{receiver_email}\" is not valid")
 
+        except SMTPAuthenticationError:
+            self.close()
+            result = dict(status="SMTPAuthenticationError", message="The server did not accept the credentials")
 
+        except (SMTPConnectError, SMTPServerDisconnected):
+            self.close()
+            result = dict(status="SMTPConnectError", message="Could not connect to the server")
 
+        except SMTPException as error:
+            # e.g. the server rejected the message; the connection may be in any state
+            self.close()
+            result = dict(status=type(error).__name__, message=f"The server did not send the email: {error}")
 
-class FigureDownloader:
-    def __init__(self, save_dir, engine='plotly'):
-        if engine not in ['plotly', 'matplotlib']:
-            raise ValueError(f"Invalid engine '{engine}'")
-            
-        self.save_dir = save_dir
-        if not os.path.exists(save_dir):
-            os.mkdir(self.save_dir)
-        self.engine = engine
-        
-    def save_plotly_figure_as_image(self, fig):
-        parent = f"{self.save_dir}/plotly"
+        except OSError:
+            # after SMTPException, which is a subclass of OSError
+            self.close()
+            result = dict(status="SMTPConnectError", message="Could not connect to the server")
+
+        on_progress(1.0, result['message'])
+        return result
+
+
+class EmailJob:
+    """
+    Status of an email queued in an ``EmailQueue``. The worker thread updates
+    ``status``, ``message`` and ``progress`` as it sends the email.
+    """
+    def __init__(self, receiver_email, subject, images: list):
+        self.receiver_email = receiver_email
+        self.subject = subject
+        self.images = list(images)
+        self.status = "queued"
+        self.message = "Waiting in the queue"
+        self.progress = 0.0
+        self.__done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.__done.is_set()
+
+    @property
+    def succeeded(self) -> bool:
+        return self.status == "success"
+
+    def wait(self, timeout=None) -> bool:
+        return self.__done.wait(timeout)
+
+    def update(self, progress, message):
+        self.status = "sending"
+        self.progress = progress
+        self.message = message
+
+    def finish(self, result: dict):
+        self.status = result['status']
+        self.message = result['message']
+        self.progress = 1.0
+        self.__done.set()
+
+
+class EmailQueue:
+    """
+    Sends emails from a background thread so the app never waits for the SMTP
+    server.
+
+    Jobs queued within ``batch_window`` seconds of each other for the same
+    receiver are sent as a single email with all their attachments. The
+    connection of the sender is kept open while there is work and closed after
+    ``idle_timeout`` seconds without jobs.
+    """
+    def __init__(self, sender: EmailSender, batch_window=EMAIL_BATCH_WINDOW, idle_timeout=SMTP_IDLE_TIMEOUT):
+        self.sender = sender
+        self.batch_window = batch_window
+        self.idle_timeout = idle_timeout
+        self.__jobs = queue.Queue()
+        self.__worker = threading.Thread(target=self.__work, name="pydockstats-email", daemon=True)
+        self.__worker.start()
 
-        if not os.path.exists(parent):
-            os.mkdir(parent)
+    def submit(self, receiver_email, subject, images: list) -> EmailJob:
+        """
+        Queues an email and returns its job right away.
 
-        path = f"{parent}/{fig.name}.png"
-        fig.write_image(path)
+        Args:
+            images: (file name, PNG bytes) pairs, where the bytes may also be a
+                future of the bytes (see ``FigureDownloader.submit``).
+        """
+        job = EmailJob(receiver_email, subject, images)
+        self.__jobs.put(job)
+        return job
 
-        return path
-    
-    def save_fig(self, name, dir, fig: go.Figure):
-        if not os.path.exists(dir):
-            os.mkdir(dir)
+    def __work(self):
+        while True:
+            try:
+                jobs = [self.__jobs.get(timeout=self.idle_timeout)]
+            except queue.Empty:
+                self.sender.close()
+                continue
 
-        img_path = f"{dir}/{name}.png"
+            # wait a little for more jobs to send together
+            deadline = time.monotonic() + self.batch_window
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    jobs.append(self.__jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
 
-        paths_cache: dict = st.session_state['paths']
-        if paths_cache.get(name):
-            return img_path
+            batches = {}
+            for job in jobs:
+                batches.setdefault(job.receiver_email, []).append(job)
 
-        fig = get_plt_from_plotly(fig)
-        fig.savefig(img_path, dpi=200)
-        plt.close()
+            for receiver_email, batch in batches.items():
+                self.__send(receiver_email, batch)
 
-        st.session_state['paths'][name] = img_path
+    def __send(self, receiver_email, batch: list):
+        def on_progress(fraction, step):
+            for job in batch:
+                job.update(fraction, step)
 
-        return img_path
+        try:
+            on_progress(0.0, "Rendering the figures")
+            # later images with the same file name replace the earlier ones
+            images = {}
+            for job in batch:
+                for file_name, data in job.images:
+                    images[file_name] = data.result() if isinstance(data, Future) else data
+
+            result = self.sender.send_email_with_images(receiver_email, batch[0].subject, list(images.items()),
+                                                        on_progress=on_progress)
+        except Exception as error:
+            result = dict(status="error", message=str(error))
+            on_progress(1.0, result['message'])
+
+        for job in batch:
+            job.finish(result)
+
+
+def figure_digest(fig: go.Figure, *extra) -> str:
+    """
+    Content digest of a figure: the data and style of every trace plus the
+    titles and axis ranges, so any visible change gives a new digest.
+    """
+    digest = hashlib.sha256()
+    layout = fig.layout
+    digest.update(repr((layout.title.text, layout.xaxis.title.text, layout.yaxis.title.text,
+                        layout.xaxis.range, layout.yaxis.range, extra)).encode())
+
+    for trace in fig.data:
+        digest.update(repr((trace.name, trace.line.color, trace.line.width, trace.line.dash)).encode())
+        digest.update(np.asarray(trace.x, dtype=float).tobytes())
+        digest.update(np.asarray(trace.y, dtype=float).tobytes())
+
+    return digest.hexdigest()
+
+
+def read_bytes(path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class FigureCache:
+    """
+    Bounded cache of rendered figures (PNG bytes) keyed by ``figure_digest``.
+
+    The images are kept in an in-memory LRU of ``memory_entries``. With a
+    ``directory`` they are also written there, and beyond ``max_entries`` files
+    the least recently used ones are evicted.
+    """
+    def __init__(self, directory=None, max_entries=FIGURE_CACHE_ENTRIES, memory_entries=FIGURE_MEMORY_ENTRIES):
+        self.directory = directory
+        self.__memory = MemoryLRU(memory_entries)
+        self.__disk = DiskLRU(directory, ".png", max_entries) if directory else None
+
+    def path(self, digest) -> str:
+        return self.__disk.path(digest)
+
+    def get(self, digest):
+        data = self.__memory.get(digest)
+        if data is not None or self.__disk is None:
+            return data
+
+        data = self.__disk.read(digest, read_bytes)
+        if data is not None:
+            self.__memory.put(digest, data)
+        return data
+
+    def put(self, digest, data: bytes) -> bytes:
+        self.__memory.put(digest, data)
+
+        if self.__disk is not None:
+            self.__disk.write(digest, lambda f: f.write(data))
+
+        return data
 
-    
-    def read_image(self, path):
-        with open(path, 'rb') as f:
-            return f.read()
 
-    def download(self, curve: Chart):
+# Shared by every session; set PYDOCKSTATS_FIGURE_DIR to also keep the images on disk
+FIGURE_CACHE = FigureCache(directory=os.environ.get("PYDOCKSTATS_FIGURE_DIR"))
+
+
+class FigureDownloader:
+    """
+    Exports charts as PNG bytes. A chart is only rendered when its image is
+    requested and is not already in the cache, which is keyed by the content
+    of the figure rather than the name of the chart.
+
+    Without a ``save_dir`` the images never touch the disk and the cache is
+    the shared ``FIGURE_CACHE``.
+    """
+    def __init__(self, save_dir=None, engine='plotly', dpi=200):
+        if engine not in ['plotly', 'matplotlib']:
+            raise ValueError(f"Invalid engine '{engine}'")
+
+        self.save_dir = save_dir
+        self.engine = engine
+        self.dpi = dpi
+        self.cache = FigureCache(os.path.join(save_dir, engine)) if save_dir else FIGURE_CACHE
+
+    def digest(self, curve: Chart) -> str:
+        return figure_digest(curve.get_figure(), self.engine, self.dpi)
+
+    def is_rendered(self, curve: Chart) -> bool:
+        return self.cache.get(self.digest(curve)) is not None
+
+    def submit(self, curve: Chart) -> Future:
+        """
+        Starts rendering the chart image in the render pool and returns a future
+        of its PNG bytes. The future is already done if the image is cached, and
+        is shared with any session rendering the same figure.
+        """
         plotly_fig = curve.get_figure()
+        with stage("figure_cache", chart=curve.name, engine=self.engine):
+            digest = self.digest(curve)
+            data = self.cache.get(digest)
+
+        if data is not None:
+            future = Future()
+            future.set_result(data)
+            return future
 
-        if self.engine == 'matplotlib':
-            parent = f"{self.save_dir}/{self.engine}"
+        with _pending_lock:
+            if digest in _pending:
+                return _pending[digest]
+            future = _pending[digest] = Future()
 
-            return self.save_fig(curve.name, parent, plotly_fig)
-        
-        elif self.engine == 'plotly':
-            return self.save_plotly_figure_as_image(plotly_fig)
+        started = time.perf_counter()
+        try:
+            if self.engine == 'matplotlib':
+                job = render_pool().submit(render_png, figure_spec(plotly_fig), self.dpi)
+            elif self.engine == 'plotly':
+                job = render_pool().submit(plotly_png, plotly_fig)
+        except Exception as error:
+            with _pending_lock:
+                _pending.pop(digest, None)
+            future.set_exception(error)
+            return future
+
+        # the render runs in another process, so only its wall time (queueing included) is measured
+        job.add_done_callback(lambda job: profiling.record("render", time.perf_counter() - started,
+                                                           chart=curve.name, engine=self.engine))
+        job.add_done_callback(lambda job: self.__store(digest, job, future))
+        return future
 
+    def __store(self, digest, job, future: Future):
+        with _pending_lock:
+            _pending.pop(digest, None)
+
+        try:
+            future.set_result(self.cache.put(digest, job.result()))
+        except Exception as error:
+            future.set_exception(error)
 
-            
\ No newline at end of file
+    def download(self, curve: Chart) -> bytes:
+        """Returns the PNG bytes of the chart image, rendering it if it is not cached."""
+        with stage("download", chart=curve.name, engine=self.engine):
+            return self.submit(curve).result()
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+
+from model.cache import CurvesCache, curves_key
+from model.pydockstats import calculate_curves
+from utils.putils import generate_artificial_scores
+from utils.saving import FigureCache
+
+EF_CUTOFFS = [0.01, 0.05, 0.1]
+
+
+def make_curves(seed=0, n_resamples=20):
+    data = generate_artificial_scores(500, seed=seed)
+    scores = np.r_[data["ligands"], data["decoys"]]
+    activity = np.r_[np.ones(len(data["ligands"]), dtype=np.int8), np.zeros(len(data["decoys"]), dtype=np.int8)]
+    curves = calculate_curves("program", scores, activity, "logistic", ef_cutoffs=EF_CUTOFFS,
+                              n_resamples=n_resamples)
+    return curves_key(scores, activity, seed=seed), curves
+
+
+def assert_same_curves(result, expected):
+    assert result.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            assert_same_curves(result[key], value)
+        else:
+            np.testing.assert_array_equal(result[key], value, err_msg=key)
+
+
+def test_disk_round_trip(tmp_path):
+    key, curves = make_curves()
+    CurvesCache(directory=str(tmp_path)).put(key, curves)
+
+    # a new cache has nothing in memory, so the curves come from the disk
+    memory_hit = CurvesCache()
+    memory_hit.put(key, curves)
+    memory_curves = memory_hit.get(key)
+    disk_curves = CurvesCache(directory=str(tmp_path)).get(key)
+
+    assert_same_curves(disk_curves, curves)
+    assert_same_curves(disk_curves, memory_curves)
+    # the EF cutoffs are float keys in both tiers
+    for tier_curves in (memory_curves, disk_curves):
+        assert list(tier_curves["pc"]["ef_cutoffs"]) == EF_CUTOFFS
+        assert list(tier_curves["pc"]["ef_cutoffs_ci"]) == EF_CUTOFFS
+    assert not disk_curves["roc"]["x"].flags.writeable
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    keys_curves = [make_curves(seed, n_resamples=0) for seed in range(3)]
+    sizes = []
+    for key, curves in keys_curves:
+        cache = CurvesCache()
+        cache.put(key, curves)
+        sizes.append(cache.nbytes)
+
+    # room for the last two results only
+    cache = CurvesCache(max_bytes=sizes[1] + sizes[2])
+    for key, curves in keys_curves:
+        cache.put(key, curves)
+
+    assert cache.get(keys_curves[0][0]) is None
+    assert cache.get(keys_curves[1][0]) is not None
+    assert cache.get(keys_curves[2][0]) is not None
+    assert cache.nbytes == sizes[1] + sizes[2]
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = FigureCache(directory=str(tmp_path), max_entries=2, memory_entries=1)
+    cache.put("a", b"a")
+    cache.put("b", b"b")
+    os.utime(cache.path("a"), (0, 0))
+    os.utime(cache.path("b"), (1, 1))
+    assert cache.get("a") == b"a"  # read from the disk, which makes it the most recently used
+    cache.put("c", b"c")
+
+    assert sorted(os.listdir(tmp_path)) == ["a.png", "c.png"]
+    assert FigureCache(directory=str(tmp_path)).get("c") == b"c"
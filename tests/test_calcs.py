@@ -0,0 +1,49 @@
+import numpy as np
+
+from utils.calcs import exp_rank_sum, pro_rata_top_actives
+
+# three tie groups in rank order, and an empty one as the bootstrap segments may have
+GROUP_ACTIVES = np.array([2.0, 0.0, 1.0, 3.0])
+GROUP_SIZES = np.array([4.0, 0.0, 3.0, 5.0])
+
+
+def ranked_activity(top):
+    """The activity of every rank, with the actives at the top (or the bottom) of their tie group."""
+    groups = []
+    for actives, size in zip(GROUP_ACTIVES.astype(int), GROUP_SIZES.astype(int)):
+        group = [1] * actives + [0] * (size - actives)
+        groups.extend(group if top else group[::-1])
+    return np.array(groups)
+
+
+def test_exp_rank_sum_matches_the_direct_sum():
+    n, alpha = 50, 20.0
+    ranks = np.arange(7, 19)
+    assert np.isclose(exp_rank_sum(7, 19, n, alpha), np.sum(np.exp(-alpha * ranks / n)))
+    assert exp_rank_sum(5, 5, n, alpha) == 0
+
+
+def test_pro_rata_top_actives():
+    cutoffs = np.arange(int(GROUP_SIZES.sum()) + 1)
+    estimate, lower, upper = pro_rata_top_actives(cutoffs, GROUP_ACTIVES, GROUP_SIZES)
+
+    np.testing.assert_array_equal(upper, np.r_[0, np.cumsum(ranked_activity(top=True))])
+    np.testing.assert_array_equal(lower, np.r_[0, np.cumsum(ranked_activity(top=False))])
+
+    # the actives of a tie group are spread evenly over its ranks
+    ends = np.cumsum(GROUP_SIZES)
+    np.testing.assert_array_equal(estimate[ends.astype(int)], np.cumsum(GROUP_ACTIVES))
+    assert np.isclose(estimate[6], 2 + 2 * 1 / 3)
+
+
+def test_pro_rata_top_actives_by_row():
+    rows_actives = np.stack([GROUP_ACTIVES, GROUP_ACTIVES[::-1]])
+    rows_sizes = np.stack([GROUP_SIZES, GROUP_SIZES[::-1]])
+    cutoffs = [0, 3, 6, 12]
+
+    by_row = pro_rata_top_actives(cutoffs, rows_actives, rows_sizes)
+    for row in range(2):
+        for values, expected in zip(by_row, pro_rata_top_actives(cutoffs, rows_actives[row], rows_sizes[row])):
+            np.testing.assert_array_equal(values[row], expected)
+
+    assert pro_rata_top_actives([], rows_actives, rows_sizes)[0].shape == (2, 0)
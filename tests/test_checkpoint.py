@@ -0,0 +1,55 @@
+import io
+
+import numpy as np
+import pytest
+
+from components import program as program_module
+from components.program import Program
+from model.cache import CURVES_CACHE
+from utils.checkpoint import Checkpoint, write_checkpoint
+from utils.putils import generate_artificial_scores
+
+N_RESAMPLES = 50
+
+
+def generated_program():
+    data = generate_artificial_scores(300, seed=0)
+    program = Program("program")
+    program.set_data(data["ligands"], data["decoys"])
+    program.generate(n_resamples=N_RESAMPLES)
+    return program
+
+
+def no_calculate_curves(*args, **kwargs):
+    raise AssertionError("the curves were computed again")
+
+
+def test_saved_curves_are_restored_with_the_saved_settings(monkeypatch):
+    program = generated_program()
+    file = io.BytesIO()
+    write_checkpoint({program.name: program.to_dict()}, file, settings=dict(n_resamples=N_RESAMPLES))
+
+    checkpoint = Checkpoint(io.BytesIO(file.getvalue()))
+    assert checkpoint.settings == dict(n_resamples=N_RESAMPLES)
+
+    CURVES_CACHE.clear()
+    monkeypatch.setattr(program_module, "calculate_curves", no_calculate_curves)
+    restored = Program(program.name)
+    restored.from_dict(checkpoint[program.name])
+    restored.generate(n_resamples=checkpoint.settings["n_resamples"])
+
+    assert restored.data_hash == program.data_hash
+    assert restored.bedroc_ci == program.bedroc_ci
+    np.testing.assert_array_equal(restored.tpr, program.tpr)
+
+    # other settings give other curves, which are computed again
+    with pytest.raises(AssertionError, match="computed again"):
+        restored.generate(n_resamples=0)
+
+
+def test_checkpoints_without_settings():
+    program = generated_program()
+    file = io.BytesIO()
+    write_checkpoint({program.name: program.to_dict()}, file)
+
+    assert Checkpoint(io.BytesIO(file.getvalue())).settings == {}
@@ -0,0 +1,19 @@
+import pandas as pd
+import pytest
+
+from cli import evaluate_file, find_result_files
+
+
+def test_directories_skip_score_lists(tmp_path):
+    pd.DataFrame({"score": [-9.0, -8.0, -6.0, -5.0], "activity": [1, 1, 0, 0]}).to_csv(tmp_path / "a.csv", index=False)
+    (tmp_path / "c.lst").write_text("-7.1\n-6.2\n")
+
+    assert find_result_files([str(tmp_path)]) == [str(tmp_path / "a.csv")]
+
+
+def test_file_without_activity_column(tmp_path):
+    path = tmp_path / "c.lst"
+    path.write_text("-7.1\n-6.2\n")
+
+    with pytest.raises(ValueError, match="no activity column"):
+        evaluate_file(str(path), [0.01])
@@ -0,0 +1,43 @@
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from model.cache import flatten
+from model.pydockstats import calculate_curves
+from utils.putils import generate_artificial_scores
+
+# calibration, n_bins and n_resamples of each call, mixed so concurrent calls fit different models
+SETTINGS = [("sklearn", None, 0), ("logistic", None, 0), ("logistic", 32, 0), ("isotonic", None, 0),
+            ("sklearn", None, 50)]
+N_CALLS = 20
+
+
+def screen(seed):
+    data = generate_artificial_scores(2_000, seed=seed)
+    scores = np.r_[data["ligands"], data["decoys"]]
+    activity = np.r_[np.ones(len(data["ligands"]), dtype=np.int8), np.zeros(len(data["decoys"]), dtype=np.int8)]
+    return scores, activity
+
+
+def run(seed):
+    calibration, n_bins, n_resamples = SETTINGS[seed % len(SETTINGS)]
+    scores, activity = screen(seed)
+    with warnings.catch_warnings():
+        # deprecation notices of the installed scikit-learn
+        warnings.simplefilter("ignore", FutureWarning)
+        return flatten(calculate_curves(f"program {seed}", scores, activity, calibration,
+                                        n_resamples=n_resamples, n_bins=n_bins))
+
+
+@pytest.mark.parametrize("max_workers", [4, 8])
+def test_concurrent_curves_match_serial(max_workers):
+    serial = [run(seed) for seed in range(N_CALLS)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        concurrent = list(executor.map(run, range(N_CALLS)))
+
+    for seed, (expected, result) in enumerate(zip(serial, concurrent)):
+        assert result.keys() == expected.keys()
+        for key in expected:
+            np.testing.assert_array_equal(result[key], expected[key], err_msg=f"call {seed}: {key}")
@@ -0,0 +1,176 @@
+import email
+import socket
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+from aiosmtpd.smtp import AuthResult  # noqa: E402
+
+from utils.saving import EmailQueue, EmailSender  # noqa: E402
+
+SENDER = "pydockstats@example.com"
+RECEIVER = "user@example.com"
+PASSWORD = "secret"
+TIMEOUT = 10
+
+
+class Handler:
+    """Keeps the delivered messages and the sessions (i.e. connections) that logged in."""
+    def __init__(self, reject=False):
+        self.reject = reject
+        self.messages = []
+        self.logins = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        if self.reject:
+            return "554 Message rejected"
+        self.messages.append(email.message_from_bytes(envelope.content))
+        return "250 OK"
+
+    def authenticate(self, server, session, envelope, mechanism, auth_data):
+        self.logins.append(id(session))
+        # not handled, so the server replies 535 to a wrong password
+        return AuthResult(success=auth_data.password == PASSWORD.encode(), handled=False)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(handler, port):
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port,
+                                                authenticator=handler.authenticate, auth_require_tls=False)
+    controller.start()
+    return controller
+
+
+@pytest.fixture
+def server():
+    handler = Handler()
+    controller = start_server(handler, free_port())
+    yield handler, controller
+    controller.stop()
+
+
+def make_sender(controller, password=PASSWORD):
+    return EmailSender(controller.hostname, controller.port, starttls=False, sender_email=SENDER, password=password)
+
+
+def attachments(message):
+    return {part.get_filename(): part.get_payload(decode=True) for part in message.walk() if part.get_filename()}
+
+
+def test_delivery(server):
+    handler, controller = server
+    sender = make_sender(controller)
+    steps = []
+
+    result = sender.send_email_with_images(RECEIVER, "Figures", [("roc.png", b"roc")],
+                                           on_progress=lambda fraction, step: steps.append((fraction, step)))
+    sender.close()
+
+    assert result["status"] == "success"
+    assert steps[-1] == (1.0, result["message"])
+    assert [fraction for fraction, _ in steps] == sorted(fraction for fraction, _ in steps)
+
+    [message] = handler.messages
+    assert message["To"] == RECEIVER
+    assert message["Subject"] == "Figures"
+    assert attachments(message) == {"roc.png": b"roc"}
+
+
+def test_queue_batches_jobs_within_window(server):
+    handler, controller = server
+    queue = EmailQueue(make_sender(controller), batch_window=1.0)
+
+    jobs = [queue.submit(RECEIVER, "Figures", [("pc.png", b"pc"), ("roc.png", b"old roc")]),
+            queue.submit(RECEIVER, "Figures", [("roc.png", b"roc"), ("precision_recall.png", b"pr")])]
+    assert all(job.wait(TIMEOUT) for job in jobs)
+
+    assert all(job.succeeded for job in jobs)
+    # a single email, where the later image of the same name replaces the earlier one
+    [message] = handler.messages
+    assert attachments(message) == {"pc.png": b"pc", "roc.png": b"roc", "precision_recall.png": b"pr"}
+
+
+def test_queue_reuses_connection(server):
+    handler, controller = server
+    queue = EmailQueue(make_sender(controller), batch_window=0)
+
+    for name in ("pc.png", "roc.png", "precision_recall.png"):
+        job = queue.submit(RECEIVER, "Figures", [(name, b"png")])
+        assert job.wait(TIMEOUT) and job.succeeded
+
+    assert len(handler.messages) == 3
+    assert len(handler.sessions) == 1
+    assert len(handler.logins) == 1
+
+
+def test_sender_reconnects_after_dropped_connection():
+    handler = Handler()
+    controller = start_server(handler, free_port())
+    sender = make_sender(controller)
+    try:
+        assert sender.send_email_with_images(RECEIVER, "Figures", [("pc.png", b"pc")])["status"] == "success"
+    finally:
+        controller.stop()
+
+    # the server goes away with the connection open, then comes back on the same port
+    controller = start_server(handler, controller.port)
+    try:
+        result = sender.send_email_with_images(RECEIVER, "Figures", [("roc.png", b"roc")])
+        sender.close()
+    finally:
+        controller.stop()
+
+    assert result["status"] == "success"
+    assert len(handler.messages) == 2
+    assert len(handler.sessions) == 2
+    assert len(handler.logins) == 2
+
+
+def test_login_failure_is_reported(server):
+    handler, controller = server
+    queue = EmailQueue(make_sender(controller, password="wrong"), batch_window=0)
+    steps = []
+
+    job = queue.submit(RECEIVER, "Figures", [("pc.png", b"pc")])
+    assert job.wait(TIMEOUT)
+
+    assert not job.succeeded
+    assert job.status == "SMTPAuthenticationError"
+    assert job.message == "The server did not accept the credentials"
+    assert handler.messages == []
+
+    # the same failure through the progress callback of the sender
+    result = make_sender(controller, password="wrong").send_email_with_images(
+        RECEIVER, "Figures", [("pc.png", b"pc")], on_progress=lambda fraction, step: steps.append(step))
+    assert steps[-1] == result["message"] == job.message
+
+
+def test_send_failure_is_reported():
+    handler = Handler(reject=True)
+    controller = start_server(handler, free_port())
+    try:
+        queue = EmailQueue(make_sender(controller), batch_window=0)
+        steps = []
+        sender = make_sender(controller)
+        result = sender.send_email_with_images(RECEIVER, "Figures", [("pc.png", b"pc")],
+                                               on_progress=lambda fraction, step: steps.append(step))
+
+        job = queue.submit(RECEIVER, "Figures", [("pc.png", b"pc")])
+        assert job.wait(TIMEOUT)
+    finally:
+        controller.stop()
+
+    assert result["status"] == "SMTPDataError"
+    assert "Message rejected" in result["message"]
+    assert steps[-1] == result["message"]
+
+    assert not job.succeeded
+    assert job.status == "SMTPDataError"
+    assert job.message == result["message"]
@@ -0,0 +1,27 @@
+from components.program import Program
+
+
+def program_with_ids(ligand_ids, decoy_ids):
+    program = Program("program")
+    program.set_data([-9.0, -8.5], [-6.0, -5.5], ligand_ids, decoy_ids)
+    return program
+
+
+def test_ids_hash_depends_on_the_ids_only():
+    first = program_with_ids(["L1", "L2"], ["D1", "D2"])
+    # new strings with the same content, as after an edit or a checkpoint load
+    same = program_with_ids(["".join(["L", "1"]), "L2"], ["D1", "".join(["D", "2"])])
+    assert first.ids_hash == same.ids_hash
+
+    assert program_with_ids(["L1", "L3"], ["D1", "D2"]).ids_hash != first.ids_hash
+    assert program_with_ids(["L1", "L2"], ["D2", "D1"]).ids_hash != first.ids_hash
+    # the ids are not concatenated before hashing
+    assert program_with_ids(["L1L", "2"], ["D1", "D2"]).ids_hash != first.ids_hash
+    assert program_with_ids(None, None).ids_hash != first.ids_hash
+
+
+def test_ids_hash_survives_a_round_trip():
+    program = program_with_ids(["L1", "L2"], ["D1", "D2"])
+    restored = Program("program")
+    restored.from_dict(program.to_dict())
+    assert restored.ids_hash == program.ids_hash
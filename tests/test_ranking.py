@@ -0,0 +1,41 @@
+import numpy as np
+from sklearn.metrics import precision_recall_curve, roc_curve
+
+from model.streaming import HistogramRanking, ScoreHistogram
+from utils.calcs import RankingContext, TieGroupRanking
+
+
+def screen():
+    rng = np.random.default_rng(0)
+    scores = np.round(rng.normal(size=2000), 1)
+    activity = (rng.random(2000) < 0.05 + 0.2 * (scores < -0.5)).astype(int)
+    return scores, activity
+
+
+def test_ranking_context_curves_match_sklearn():
+    scores, activity = screen()
+    ranking = RankingContext(activity, -scores)
+
+    for ours, expected in zip(ranking.roc_curve(), roc_curve(activity, -scores)):
+        np.testing.assert_allclose(ours, expected)
+    for ours, expected in zip(ranking.precision_recall_curve(), precision_recall_curve(activity, -scores)):
+        np.testing.assert_allclose(ours, expected)
+    assert ranking.n == len(scores) and ranking.n_actives == activity.sum()
+
+
+def test_histogram_ranking_is_a_tie_group_ranking():
+    scores, activity = screen()
+    histogram = ScoreHistogram(scores.min(), scores.max(), n_bins=16)
+    histogram.update(scores, activity)
+    ranking = HistogramRanking(histogram)
+
+    assert isinstance(ranking, TieGroupRanking)
+    # the order of the compounds is unknown, so none of the methods that need it are inherited
+    assert not isinstance(ranking, RankingContext)
+    assert ranking.n == len(scores) and ranking.n_actives == activity.sum()
+    assert np.isclose(ranking.prevalence, activity.mean())
+
+    fpr, tpr, _ = ranking.roc_curve()
+    assert fpr[0] == tpr[0] == 0 and fpr[-1] == tpr[-1] == 1
+    precision, recall, _ = ranking.precision_recall_curve()
+    assert recall[0] == 1 and recall[-1] == 0